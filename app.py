@@ -1,23 +1,49 @@
-from flask import Flask
+import os
+
+from flask import Flask, jsonify
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from datetime import timedelta
 
-from models import db,TokenBlocklist
+from models import db
+from db_profiles import apply_connection_profile, configure_database
+from blocklist import revocation_cache, start_background_purger
+from changelog import start_background_compactor
+from deletion import start_background_user_purger
+from broker import event_broker
+from cache import entity_cache
+from compression import response_compressor
+from hashing import password_hasher
+import metrics
+from logs import structured_logging
+from commands import blocklist_cli, changes_cli, events_cli, users_cli
 
 # Import blueprints from the views folder
 from views.user import user_bp  
 from views.event import event_bp  
 from views.auth import auth_bp  
+from views.changes import changes_bp
 
 app = Flask(__name__)
 
+# JSON logs written by a background thread; records at INFO and below are
+# sampled per endpoint (endpoint -> fraction kept)
+app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO")
+app.config["LOG_SAMPLE_RATES"] = {"auth_bp.current_user": 0.1}
+structured_logging.init_app(app)
+
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///events.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///events.db')
+# Connection pragmas and pool settings, see db_profiles.PROFILES
+app.config['DATABASE_PROFILE'] = os.environ.get('DATABASE_PROFILE', 'sqlite-wal')
+# Read-only views use this engine; defaults to a query_only pool on the same SQLite file
+app.config['DATABASE_REPLICA_URI'] = os.environ.get('DATABASE_REPLICA_URL')
+configure_database(app)
 
 # Initialize migrations and database
 migrate = Migrate(app, db)
 db.init_app(app)
+apply_connection_profile(app, db)
 
 # JWT configuration
 app.config["JWT_SECRET_KEY"] = "user" 
@@ -25,16 +51,91 @@ app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=2)
 jwt = JWTManager(app)
 jwt.init_app(app)
 
+# Per-worker cache of revoked tokens
+revocation_cache.init_app(app)
+
+# Read-through cache for single user and event lookups ("memory" or "shared")
+app.config["ENTITY_CACHE_BACKEND"] = "memory"
+app.config["ENTITY_CACHE_SIZE"] = 10000
+app.config["ENTITY_CACHE_TTL"] = 300
+entity_cache.init_app(app)
+
+# Event changes are pushed to /events/stream clients through a broker
+# ("memory" for this worker only, "shared" for the stand-in for one shared by
+# every worker). Clients more than EVENT_STREAM_MAX_PENDING messages behind
+# are disconnected; idle streams get a heartbeat every EVENT_STREAM_HEARTBEAT seconds.
+# Each stream holds a request thread, so at most EVENT_STREAM_MAX_SUBSCRIBERS are served
+app.config["EVENT_STREAM_BROKER"] = "memory"
+app.config["EVENT_STREAM_MAX_PENDING"] = 100
+app.config["EVENT_STREAM_HEARTBEAT"] = 15
+app.config["EVENT_STREAM_MAX_SUBSCRIBERS"] = 32
+event_broker.init_app(app)
+
+# JSON bodies of COMPRESS_MIN_SIZE bytes or more are gzipped for clients that
+# accept it; the compressed copies of responses with an ETag are kept for reuse.
+# Level 3 gets within a few percent of level 9's size at a fraction of the CPU
+app.config["COMPRESS_MIN_SIZE"] = 1024
+app.config["COMPRESS_LEVEL"] = 3
+app.config["COMPRESS_CACHE_SIZE"] = 1000
+app.config["COMPRESS_CACHE_TTL"] = 300
+response_compressor.init_app(app)
+
+# Password hashing runs on a bounded pool; changing the method or cost makes
+# logins re-hash old passwords
+app.config["PASSWORD_HASH_METHOD"] = "scrypt:32768:8:1"
+app.config["PASSWORD_HASH_WORKERS"] = 4
+app.config["PASSWORD_HASH_QUEUE"] = 32
+password_hasher.init_app(app)
+
+# Expired blocklist rows are purged with `flask blocklist purge`, or on a
+# background thread when an interval (in seconds) is configured
+app.config["BLOCKLIST_PURGE_INTERVAL"] = 0
+start_background_purger(app)
+
+# Deleting a user removes their events this many rows per transaction. Users
+# with more events than the threshold (or deleted with ?async=true) are only
+# marked deleted and purged on a background thread, woken on each soft
+# delete and every USER_PURGE_INTERVAL seconds
+app.config["USER_DELETE_BATCH_SIZE"] = 500
+app.config["USER_DELETE_PAUSE"] = 0.0
+app.config["USER_DELETE_ASYNC_THRESHOLD"] = 5000
+app.config["USER_PURGE_INTERVAL"] = 60
+start_background_user_purger(app)
+
+# Change feed entries are kept this many days; compaction also drops entries
+# superseded by a later change to the same row
+app.config["CHANGE_LOG_RETENTION_DAYS"] = 30
+app.config["CHANGE_LOG_COMPACT_BATCH_SIZE"] = 500
+app.config["CHANGE_LOG_COMPACT_INTERVAL"] = 3600
+start_background_compactor(app)
+app.cli.add_command(blocklist_cli)
+app.cli.add_command(users_cli)
+app.cli.add_command(events_cli)
+app.cli.add_command(changes_cli)
+
+# Per-endpoint latency and SQL statement histograms, served at /metrics
+metrics.init_app(app, db)
+
 # Register blueprints
 app.register_blueprint(user_bp) 
 app.register_blueprint(event_bp)  
 app.register_blueprint(auth_bp)  
+app.register_blueprint(changes_bp)
 
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
     jti = jwt_payload["jti"]
-    token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
+    return revocation_cache.is_revoked(jti)
+
+
+# Hit and miss counters for tuning the cache sizes
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify({
+        "entities": entity_cache.stats(),
+        "revoked_tokens": revocation_cache.stats()
+    })
 
 
 
@@ -0,0 +1,820 @@
+"""Optional ASGI serving mode for the event and user APIs.
+
+The handlers below mirror the routes in views/event.py and views/user.py,
+but run as coroutines on async SQLAlchemy sessions over aiosqlite, so a
+request waiting on the database doesn't hold a thread. The models are the
+ones in models.py; the schema is still managed by `flask db upgrade`.
+
+    uvicorn asgi:app --port 8000
+
+Auth routes, metrics and logging stay on the WSGI app in app.py.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+from urllib.parse import parse_qs
+
+from sqlalchemy import event as sa_event, insert, select, text, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from broker import event_broker, format_message
+from cache import entity_cache
+from conditional import etag_for
+from db_profiles import PROFILES, _pragma_listener
+from deletion import OWNER_NOT_DELETED, delete_or_schedule
+from event_stats import event_stats_page
+from fieldsets import parse_fields, project
+from hashing import HasherBusy, password_hasher
+from lookup import LOOKUP_CHUNK_SIZE, parse_ids
+from models import Event, User
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from search import SEARCH_SQL, match_expression
+from streaming import (
+    NDJSON_MIMETYPES, STREAM_BATCH_SIZE, STREAM_FLUSH_SIZE, _iter_json_array, _stop_on_error, chunked, iter_ndjson
+)
+from views.event import (
+    BULK_CHUNK_SIZE, EVENT_FIELDS, USER_EVENT_FIELDS, event_to_dict, parse_date, user_event_to_dict, validate_event
+)
+from views.user import USER_FIELDS, USER_LIST_FIELDS, listed_user_to_dict, user_to_dict
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+# Same settings and defaults as app.py
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///events.db")
+DATABASE_PROFILE = os.environ.get("DATABASE_PROFILE", "sqlite-wal")
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+USER_DELETE_BATCH_SIZE = 500
+USER_DELETE_ASYNC_THRESHOLD = 5000
+EVENT_STREAM_MAX_PENDING = 100
+EVENT_STREAM_HEARTBEAT = 15
+
+
+def async_url(uri):
+    """Point a sqlite:/// URL at the aiosqlite driver, resolving relative paths like Flask-SQLAlchemy."""
+    url = make_url(uri)
+    if url.get_backend_name() != "sqlite":
+        return url
+    database = url.database
+    if database and database != ":memory:" and not os.path.isabs(database):
+        database = os.path.join(INSTANCE_PATH, database)
+    return url.set(drivername="sqlite+aiosqlite", database=database)
+
+
+def create_engine_for(uri, read_only=False):
+    profile = PROFILES[DATABASE_PROFILE]
+    engine = create_async_engine(async_url(uri), **profile["engine_options"])
+    if engine.dialect.name == "sqlite":
+        pragmas = dict(profile["pragmas"])
+        if read_only:
+            # Anything that tries to write through the replica is a bug
+            pragmas["query_only"] = "ON"
+        if pragmas:
+            sa_event.listen(engine.sync_engine, "connect", _pragma_listener(pragmas))
+    return engine
+
+
+engine = create_engine_for(DATABASE_URL)
+# Read-only handlers use their own pool, on the replica if there is one
+read_engine = create_engine_for(DATABASE_REPLICA_URL or DATABASE_URL, read_only=True)
+
+Session = async_sessionmaker(engine, expire_on_commit=False)
+ReadSession = async_sessionmaker(read_engine, expire_on_commit=False)
+
+entity_cache.use_backend("memory", 10000, 300)
+# Streams are only fed by writes made through this process
+event_broker.use_backend("memory", EVENT_STREAM_MAX_PENDING)
+event_broker.heartbeat = EVENT_STREAM_HEARTBEAT
+password_hasher.configure()
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, scope, body, receive=None):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope["query_string"]
+        self.args = {
+            key: values[-1]
+            for key, values in parse_qs(self.query_string.decode("latin-1"), keep_blank_values=True).items()
+        }
+        self.headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        self.body = body
+        self.receive = receive
+
+    @property
+    def mimetype(self):
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def get_json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Invalid JSON body")
+
+    def arg_int(self, name, default=None):
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+    def page_args(self):
+        limit = max(1, min(self.arg_int("limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        return limit, self.arg_int("after", 0)
+
+    def fields(self, available):
+        return parse_fields(self.args.get("fields", ""), available)
+
+    def ids(self):
+        # Same rules as lookup.get_ids
+        if self.method == "POST":
+            try:
+                data = json.loads(self.body)
+            except ValueError:
+                data = None
+            values = data.get("ids") if isinstance(data, dict) else None
+            if not isinstance(values, list):
+                return None, "Expected a JSON object with an ids list"
+        else:
+            values = [value for value in self.args.get("ids", "").split(",") if value.strip()]
+        return parse_ids(values)
+
+    def stream_format(self):
+        # Simplified form of the Accept negotiation in streaming.stream_format
+        accept = self.headers.get("accept", "")
+        if any(mimetype in accept for mimetype in NDJSON_MIMETYPES) and "application/json" not in accept:
+            return "ndjson"
+        if self.args.get("stream", "").lower() in ("1", "true", "yes"):
+            return "json"
+        return None
+
+    def etag_matches(self, etag):
+        header = self.headers.get("if-none-match")
+        if not header:
+            return False
+        if header.strip() == "*":
+            return True
+        return '"%s"' % etag in (tag.strip() for tag in header.split(","))
+
+
+def dumps(data):
+    # Matches Flask's jsonify output
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+class Response:
+    def __init__(self, body=b"", status=200, content_type="application/json", headers=None):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.headers = [("content-type", content_type)] + list((headers or {}).items())
+
+    def _raw_headers(self):
+        return [(key.encode("latin-1"), value.encode("latin-1")) for key, value in self.headers]
+
+    async def send(self, send):
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": self._raw_headers() + [(b"content-length", str(len(self.body)).encode())]})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class StreamingResponse(Response):
+    """Sends pieces from an async iterator of str, joined into writes of about STREAM_FLUSH_SIZE."""
+
+    def __init__(self, pieces, status=200, content_type="application/json", headers=None):
+        super().__init__(b"", status, content_type, headers)
+        self.pieces = pieces
+
+    async def send(self, send):
+        await send({"type": "http.response.start", "status": self.status, "headers": self._raw_headers()})
+        buffer, size = [], 0
+        async for piece in self.pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= STREAM_FLUSH_SIZE:
+                await send({"type": "http.response.body", "body": "".join(buffer).encode(), "more_body": True})
+                buffer, size = [], 0
+        await send({"type": "http.response.body", "body": "".join(buffer).encode()})
+
+
+class EventStreamResponse(StreamingResponse):
+    """Sends each piece as soon as it is produced, until the client disconnects."""
+
+    def __init__(self, pieces, receive, headers=None):
+        super().__init__(pieces, 200, "text/event-stream", dict({"cache-control": "no-cache"}, **(headers or {})))
+        self.receive = receive
+
+    async def send(self, send):
+        await send({"type": "http.response.start", "status": self.status, "headers": self._raw_headers()})
+
+        async def forward():
+            async for piece in self.pieces:
+                await send({"type": "http.response.body", "body": piece.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            while (await self.receive())["type"] != "http.disconnect":
+                pass
+
+        # Whichever ends first cancels the other; cancelling the forwarder
+        # unwinds the generator, which unsubscribes
+        tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def jsonify(data, status=200, headers=None):
+    return Response(dumps(data), status, headers=headers)
+
+
+def stream_response(items, fmt):
+    """Async counterpart of streaming.stream_response."""
+    if fmt == "ndjson":
+        async def generate():
+            async for item in items:
+                yield dumps(item) + "\n"
+        return StreamingResponse(generate(), content_type="application/x-ndjson")
+
+    async def generate():
+        yield "["
+        separator = ""
+        async for item in items:
+            yield separator + dumps(item)
+            separator = ","
+        yield "]"
+    return StreamingResponse(generate())
+
+
+def conditional_response(request, etag, build):
+    """Answer 304 if the client already has `etag`, otherwise await `build()`."""
+    async def respond():
+        if request.etag_matches(etag):
+            response = Response(b"", 304)
+        else:
+            response = await build()
+        response.headers.append(("etag", '"%s"' % etag))
+        return response
+    return respond()
+
+
+# (method, compiled path pattern, handler, read only)
+ROUTES = []
+
+
+def route(path, methods=("GET",), read_only=False):
+    pattern = re.compile("^" + re.sub(r"<int:(\w+)>", r"(?P<\1>[0-9]+)", path) + "$")
+
+    def decorator(handler):
+        for method in methods:
+            ROUTES.append((method, pattern, handler, read_only))
+        return handler
+    return decorator
+
+
+# CREATE Event
+@route("/event", methods=["POST"])
+async def create_event(request, session):
+    fields, error = validate_event(request.get_json())
+    if error:
+        return jsonify({"message": error}, 400)
+
+    new_event = Event(**fields)
+    session.add(new_event)
+    await session.commit()
+    event = event_to_dict(new_event)
+    event_broker.publish("create", event)
+
+    return jsonify({"message": "Event created", "event": event}, 201)
+
+
+async def _insert_events(session, rows):
+    """Insert one chunk of validated rows, returning a new id or an error per row."""
+    try:
+        # New rowids are handed out in VALUES order, see views.event._insert_events
+        ids = sorted((await session.execute(insert(Event).values(rows).returning(Event.id))).scalars())
+        await session.commit()
+        return [(event_id, None) for event_id in ids]
+    except SQLAlchemyError:
+        await session.rollback()
+
+    results = []
+    for row in rows:
+        try:
+            async with session.begin_nested():
+                event_id = (await session.execute(insert(Event).returning(Event.id), row)).scalar()
+            results.append((event_id, None))
+        except SQLAlchemyError:
+            results.append((None, "Could not save event"))
+    await session.commit()
+    return results
+
+
+# CREATE Events in bulk
+@route("/events/bulk", methods=["POST"])
+async def create_events_bulk(request, session):
+    # The ASGI server hands over the whole body, so it is parsed from memory
+    # rather than incrementally off the socket
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = iter_ndjson(io.BytesIO(request.body))
+    else:
+        items = _stop_on_error(_iter_json_array(io.BytesIO(request.body)))
+
+    async def generate():
+        created = failed = 0
+        for chunk in chunked(enumerate(items), BULK_CHUNK_SIZE):
+            results = {}
+            rows, row_indexes = [], []
+            for index, (data, error) in chunk:
+                if not error:
+                    fields, error = validate_event(data)
+                if error:
+                    results[index] = {"index": index, "error": error}
+                else:
+                    rows.append(fields)
+                    row_indexes.append(index)
+
+            if rows:
+                for index, row, (event_id, error) in zip(row_indexes, rows, await _insert_events(session, rows)):
+                    if error:
+                        results[index] = {"index": index, "error": error}
+                    else:
+                        results[index] = {"index": index, "id": event_id}
+                        event_broker.publish("create", {
+                            "id": event_id, **row, "event_date": row["event_date"].isoformat()
+                        })
+
+            for index, _ in chunk:
+                if "id" in results[index]:
+                    created += 1
+                else:
+                    failed += 1
+                yield json.dumps(results[index]) + "\n"
+
+        yield json.dumps({"created": created, "failed": failed}) + "\n"
+
+    return StreamingResponse(generate(), content_type="application/x-ndjson")
+
+
+# STREAM Event changes as server-sent events
+@route("/events/stream", read_only=True)
+async def stream_events(request, session):
+    # Same stream as views.event.stream_events, but an idle client is a
+    # parked coroutine rather than a request thread
+    user_id = request.arg_int("user_id")
+    loop = asyncio.get_running_loop()
+
+    async def generate():
+        wake = asyncio.Event()
+        # The broker's dispatcher runs on its own thread
+        subscription = event_broker.subscribe(user_id, lambda: loop.call_soon_threadsafe(wake.set))
+        try:
+            yield ": subscribed\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), event_broker.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                wake.clear()
+                messages = subscription.drain()
+                if messages:
+                    yield "".join(format_message(message) for message in messages)
+                if subscription.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return EventStreamResponse(generate(), request.receive)
+
+
+async def _get_many(session, model, ids, *criteria, options=()):
+    """Async counterpart of RowSerializer.get_many, returning (objects, missing) in the order of `ids`."""
+    found = {}
+    for chunk in chunked(ids, LOOKUP_CHUNK_SIZE):
+        query = select(model).options(*options).where(model.id.in_(chunk), *criteria)
+        for obj in (await session.scalars(query)).all():
+            found[obj.id] = obj
+    return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
+
+
+# READ Events by ID, many at once
+@route("/events/lookup", methods=["POST"], read_only=True)
+async def lookup_events(request, session):
+    fields, error = request.fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+    ids, error = request.ids()
+    if error:
+        return jsonify({"message": error}, 400)
+
+    events, missing = await _get_many(session, Event, ids, OWNER_NOT_DELETED)
+    return jsonify({"events": [event_to_dict(event, fields) for event in events], "missing": missing})
+
+
+# READ Events in a date range
+@route("/events", read_only=True)
+async def list_events(request, session):
+    if "ids" in request.args:
+        return await lookup_events(request, session)
+
+    limit = max(1, min(request.arg_int("limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    user_id = request.arg_int("user_id")
+    fields, error = request.fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    query = select(Event).where(OWNER_NOT_DELETED)
+    if user_id is not None:
+        query = query.where(Event.user_id == user_id)
+    if request.args.get("from"):
+        date_from = parse_date(request.args["from"])
+        if date_from is None:
+            return jsonify({"message": "Invalid from date, expected YYYY-MM-DD"}, 400)
+        query = query.where(Event.event_date >= date_from)
+    if request.args.get("to"):
+        date_to = parse_date(request.args["to"])
+        if date_to is None:
+            return jsonify({"message": "Invalid to date, expected YYYY-MM-DD"}, 400)
+        query = query.where(Event.event_date <= date_to)
+    if request.args.get("after"):
+        after_date, _, after_id = request.args["after"].partition("_")
+        after_date = parse_date(after_date)
+        if after_date is None or not after_id.isdigit():
+            return jsonify({"message": "Invalid cursor"}, 400)
+        query = query.where(tuple_(Event.event_date, Event.id) > tuple_(after_date, int(after_id)))
+
+    events = (await session.scalars(query.order_by(Event.event_date, Event.id).limit(limit + 1))).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = "%s_%d" % (events[-1].event_date.isoformat(), events[-1].id)
+
+    return jsonify({"events": [event_to_dict(event, fields) for event in events], "next_cursor": next_cursor})
+
+
+# SEARCH Events by title and description
+@route("/events/search", read_only=True)
+async def search_events_view(request, session):
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"message": "Missing search query"}, 400)
+    fields, error = request.fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    limit, offset = request.page_args()
+    events = []
+    expression = match_expression(query)
+    if expression:
+        statement = select(Event).from_statement(text(SEARCH_SQL))
+        params = {"query": expression, "limit": limit + 1, "offset": offset}
+        events = (await session.scalars(statement, params)).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    return jsonify({
+        "events": [event_to_dict(event, fields) for event in events],
+        "next_cursor": offset + limit if has_more else None
+    })
+
+
+# READ Event by ID
+@route("/event/<int:event_id>", read_only=True)
+async def get_event(request, session, event_id):
+    fields, error = request.fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    version = await session.scalar(select(Event.version).where(Event.id == event_id, OWNER_NOT_DELETED))
+    if version is None:
+        return jsonify({"message": "Event not found"}, 404)
+
+    async def load():
+        event = await session.get(Event, event_id)
+        return event_to_dict(event) if event else None
+
+    async def build():
+        return jsonify(project(await entity_cache.get_or_load_async(Event, event_id, load, version), fields))
+
+    return await conditional_response(request, etag_for(request.query_string, "event", event_id, version), build)
+
+
+# READ all Events for a specific User
+@route("/user/<int:user_id>/events", read_only=True)
+async def get_user_events(request, session, user_id):
+    fields, error = request.fields(USER_EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    versions = (await session.execute(
+        select(Event.id, Event.version).where(Event.user_id == user_id, OWNER_NOT_DELETED)
+    )).all()
+    if not versions:
+        return jsonify({"message": "No events found for this user"}, 404)
+
+    # Same tag as the WSGI view: the negotiated format is part of it
+    fmt = request.stream_format()
+    etag = etag_for(request.query_string, "user-events", user_id, fmt, *sorted(tuple(row) for row in versions))
+    query = select(Event).filter_by(user_id=user_id).order_by(Event.id)
+
+    async def build():
+        if fmt:
+            async def rows():
+                async for event in await session.stream_scalars(
+                    query.execution_options(yield_per=STREAM_BATCH_SIZE)
+                ):
+                    yield user_event_to_dict(event, fields)
+
+            return stream_response(rows(), fmt)
+
+        events = (await session.scalars(query)).all()
+        return jsonify([user_event_to_dict(event, fields) for event in events])
+
+    response = await conditional_response(request, etag, build)
+    response.headers.append(("vary", "Accept"))
+    return response
+
+
+# UPDATE Event by ID
+@route("/event/<int:event_id>", methods=["PUT"])
+async def update_event(request, session, event_id):
+    data = request.get_json()
+    event = await session.scalar(select(Event).where(Event.id == event_id, OWNER_NOT_DELETED))
+    if not event:
+        return jsonify({"message": "Event not found"}, 404)
+
+    event_date = data.get("event_date")
+    if event_date:
+        event_date = parse_date(event_date)
+        if event_date is None:
+            return jsonify({"message": "Invalid event_date, expected YYYY-MM-DD"}, 400)
+
+    if data.get("title"):
+        event.title = data["title"]
+    if data.get("description"):
+        event.description = data["description"]
+    if event_date:
+        event.event_date = event_date
+
+    await session.commit()
+    entity_cache.invalidate(Event, event_id)
+    data = event_to_dict(event)
+    event_broker.publish("update", data)
+
+    return jsonify({"message": "Event updated", "event": data})
+
+
+# DELETE Event by ID
+@route("/event/<int:event_id>", methods=["DELETE"])
+async def delete_event(request, session, event_id):
+    event = await session.scalar(select(Event).where(Event.id == event_id, OWNER_NOT_DELETED))
+    if not event:
+        return jsonify({"message": "Event not found"}, 404)
+
+    user_id = event.user_id
+    await session.delete(event)
+    await session.commit()
+    entity_cache.invalidate(Event, event_id)
+    event_broker.publish("delete", {"id": event_id, "user_id": user_id})
+
+    return jsonify({"message": "Event deleted"})
+
+
+# READ Users by ID, many at once
+@route("/users/lookup", methods=["POST"], read_only=True)
+async def lookup_users(request, session):
+    fields, error = request.fields(USER_LIST_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+    ids, error = request.ids()
+    if error:
+        return jsonify({"message": error}, 400)
+
+    options = (selectinload(User.events),) if "events" in fields else ()
+    users, missing = await _get_many(session, User, ids, User.deleted_at.is_(None), options=options)
+    return jsonify({"users": [listed_user_to_dict(user, fields) for user in users], "missing": missing})
+
+
+# READ Users, keyset paginated
+@route("/users", read_only=True)
+async def fetch_users(request, session):
+    if "ids" in request.args:
+        return await lookup_users(request, session)
+
+    limit, after = request.page_args()
+    fields, error = request.fields(USER_LIST_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    query = select(User).where(User.id > after, User.deleted_at.is_(None)).order_by(User.id)
+    if "events" in fields:
+        query = query.options(selectinload(User.events))
+
+    fmt = request.stream_format()
+    if fmt:
+        async def rows():
+            async for user in await session.stream_scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+                yield listed_user_to_dict(user, fields)
+
+        response = stream_response(rows(), fmt)
+    else:
+        users = (await session.scalars(query.limit(limit + 1))).all()
+        has_more = len(users) > limit
+        users = users[:limit]
+        response = jsonify({
+            "users": [listed_user_to_dict(user, fields) for user in users],
+            "next_cursor": users[-1].id if has_more else None
+        })
+    response.headers.append(("vary", "Accept"))
+    return response
+
+
+# READ per-user event totals
+@route("/users/stats")
+async def user_event_stats(request, session):
+    # Not read-only: the first request of a day rolls the stats forward.
+    # The statements are the WSGI view's, run as they are
+    limit, after = request.page_args()
+    return jsonify(await session.run_sync(event_stats_page, limit, after))
+
+
+async def _username_or_email_taken(session, username, email, user_id=None):
+    for column, value, message in (
+        (User.username, username, "Username already exists"),
+        (User.email, email, "Email already exists"),
+    ):
+        if value is None:
+            continue
+        query = select(User.id).where(column == value)
+        if user_id is not None:
+            query = query.where(User.id != user_id)
+        if await session.scalar(query.limit(1)) is not None:
+            return message
+    return None
+
+
+# CREATE User
+@route("/user", methods=["POST"])
+async def create_user(request, session):
+    data = request.get_json()
+    username = data.get("username")
+    email = data.get("email")
+    password = data.get("password")
+
+    if not username or not email or not password:
+        return jsonify({"message": "Missing fields"}, 400)
+
+    taken = await _username_or_email_taken(session, username, email)
+    if taken:
+        return jsonify({"message": taken}, 400)
+
+    new_user = User(username=username, email=email, password=await password_hasher.hash_async(password))
+    session.add(new_user)
+    await session.commit()
+
+    return jsonify({"message": "User created", "user": user_to_dict(new_user)}, 201)
+
+
+# READ User by ID
+@route("/user/<int:user_id>", read_only=True)
+async def get_user(request, session, user_id):
+    fields, error = request.fields(USER_FIELDS)
+    if error:
+        return jsonify({"message": error}, 400)
+
+    version = await session.scalar(select(User.version).where(User.id == user_id, User.deleted_at.is_(None)))
+    if version is None:
+        return jsonify({"message": "User not found"}, 404)
+
+    async def load():
+        user = await session.get(User, user_id)
+        return user_to_dict(user) if user else None
+
+    async def build():
+        return jsonify(project(await entity_cache.get_or_load_async(User, user_id, load, version), fields))
+
+    return await conditional_response(request, etag_for(request.query_string, "user", user_id, version), build)
+
+
+# UPDATE User by ID
+@route("/user/<int:user_id>", methods=["PUT"])
+async def update_user(request, session, user_id):
+    data = request.get_json()
+    user = await session.get(User, user_id)
+    if not user or user.deleted_at is not None:
+        return jsonify({"message": "User not found"}, 404)
+
+    username = data.get("username", user.username)
+    email = data.get("email", user.email)
+    password = data.get("password")
+
+    taken = await _username_or_email_taken(
+        session,
+        username if username != user.username else None,
+        email if email != user.email else None,
+        user.id,
+    )
+    if taken:
+        return jsonify({"message": taken}, 400)
+
+    if username:
+        user.username = username
+    if email:
+        user.email = email
+    if password:
+        user.password = await password_hasher.hash_async(password)
+
+    await session.commit()
+    entity_cache.invalidate(User, user_id)
+
+    return jsonify({"message": "User updated", "user": user_to_dict(user)})
+
+
+# DELETE User by ID
+@route("/user/<int:user_id>", methods=["DELETE"])
+async def delete_user(request, session, user_id):
+    # The set-based deletes are plain statements, so the sync code runs as is.
+    # Soft-deleted users are purged by the WSGI app's background thread or
+    # `flask users purge-deleted`
+    outcome = await session.run_sync(
+        delete_or_schedule,
+        user_id,
+        batch_size=USER_DELETE_BATCH_SIZE,
+        async_threshold=USER_DELETE_ASYNC_THRESHOLD,
+        force_async=request.args.get("async", "").lower() in ("1", "true", "yes"),
+    )
+    if outcome is None:
+        return jsonify({"message": "User not found"}, 404)
+    entity_cache.invalidate(User, user_id)
+    if outcome == "scheduled":
+        return jsonify({"message": "User scheduled for deletion"}, 202)
+
+    return jsonify({"message": "User deleted"})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def match(method, path):
+    allowed = False
+    for route_method, pattern, handler, read_only in ROUTES:
+        found = pattern.match(path)
+        if found:
+            if route_method == method:
+                return handler, read_only, {key: int(value) for key, value in found.groupdict().items()}
+            allowed = True
+    raise HTTPError(405 if allowed else 404, "Method not allowed" if allowed else "Not found")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await engine.dispose()
+                await read_engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope, await read_body(receive), receive)
+    try:
+        handler, read_only, kwargs = match(request.method, request.path)
+        # The session stays open until the body is sent, so streamed
+        # responses can keep reading from it
+        async with (ReadSession if read_only else Session)() as session:
+            response = await handler(request, session, **kwargs)
+            await response.send(send)
+    except HTTPError as e:
+        await jsonify({"message": e.message}, e.status).send(send)
+    except HasherBusy:
+        await jsonify({"message": "Server busy, please retry"}, 503, {"retry-after": "1"}).send(send)
@@ -0,0 +1,173 @@
+"""Compare the concurrency the WSGI and ASGI apps sustain at a p99 target.
+
+Serves a copy of a bench.dataset database with each app in its own
+process: app.py on werkzeug with a fixed pool of request threads (like a
+gthread worker), asgi.py on uvicorn. The number of concurrent clients is
+then stepped up on a read-heavy mix of event and user routes, recording
+throughput and p99 at each step:
+
+    python -m bench.asgi_bench bench.db --p99-ms 250 --threads 8
+
+The report says, per server, the highest step whose p99 stayed within
+--p99-ms without errors.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.load import WORKLOAD, Run, Tickets, Worker, git_revision, summarize
+
+# Event and user routes only; auth is not served by asgi.py
+MIX = (
+    "get_event", "get_user", "list_events", "get_user_events", "search_events",
+    "fetch_users", "create_event", "update_event",
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve_wsgi(port, threads):
+    """Run app.py with `threads` request threads; used as this module's --serve-wsgi mode."""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    from app import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledWSGIServer(BaseWSGIServer):
+        # HTTP/1.0 closes each connection after its response, so an idle
+        # client never pins one of the pool's threads
+        def __init__(self):
+            super().__init__("127.0.0.1", port, app, handler=QuietHandler)
+            self.pool = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer().serve_forever()
+
+
+def start_server(kind, database, port, threads):
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + database, LOG_LEVEL="WARNING")
+    if kind == "wsgi":
+        command = [sys.executable, "-m", "bench.asgi_bench", "--serve-wsgi", str(port), "--threads", str(threads)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port),
+                   "--no-access-log", "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/user/1")
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("%s server did not start" % kind)
+
+
+def run_step(url, run, concurrency, requests, warmup, seed, workload):
+    tickets = Tickets(warmup, requests)
+    workers = [Worker(i, url, run, tickets, seed, workload) for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - tickets.measure_started if tickets.measure_started else 0.0
+
+    samples = [sample for worker in workers for sample in worker.samples]
+    return dict(
+        summarize([elapsed for _, _, elapsed in samples], seconds),
+        concurrency=concurrency,
+        errors=sum(1 for _, status, _ in samples if status == 0 or status >= 500),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", nargs="?", help="SQLite file made by bench.dataset")
+    parser.add_argument("--p99-ms", type=float, default=250.0)
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64,128", help="client counts to step through")
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per step")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per step")
+    parser.add_argument("--threads", type=int, default=8, help="request threads for the WSGI server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--serve-wsgi", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi, args.threads)
+    if not args.database:
+        parser.error("the database argument is required")
+
+    levels = [int(level) for level in args.levels.split(",")]
+    workload = {name: WORKLOAD[name] for name in MIX}
+    report = {
+        "revision": git_revision(),
+        "p99_target_ms": args.p99_ms,
+        "wsgi_threads": args.threads,
+        "requests_per_step": args.requests,
+        "mix": list(MIX),
+        "servers": {},
+    }
+
+    for kind in ("wsgi", "asgi"):
+        scratch = tempfile.mkdtemp(prefix="asgi-bench-")
+        try:
+            # Each server gets a fresh copy, since the mix includes writes
+            database = shutil.copy(os.path.abspath(args.database), os.path.join(scratch, "bench.db"))
+            run = Run(database, mint_token=None)
+            process = start_server(kind, database, args.port, args.threads)
+            url = "http://127.0.0.1:%d" % args.port
+            try:
+                steps = [
+                    run_step(url, run, level, args.requests, args.warmup, args.seed, workload)
+                    for level in levels
+                ]
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        within = [step["concurrency"] for step in steps if step["p99_ms"] <= args.p99_ms and not step["errors"]]
+        report["servers"][kind] = {
+            "max_concurrency_within_p99": max(within) if within else 0,
+            "steps": steps,
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Generate a large synthetic dataset in a scratch SQLite database.
+
+Creates the app schema and bulk-inserts users, events and blocklist rows,
+fast enough for millions of events:
+
+    python -m bench.dataset bench.db --users 100000 --events 5000000 --tokens 200000
+
+Every user gets the password PASSWORD, so the load runner can log in as
+anyone. The same --seed always produces the same rows.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+from werkzeug.security import generate_password_hash
+
+from bench.search_bench import make_vocabulary
+from changelog import CHANGES_DDL  # also registers the change log triggers
+from event_stats import REBUILD_SQL, STATS_DDL, stats_today  # also registers the stats triggers
+from models import db
+from search import SEARCH_DDL  # also registers the FTS5 DDL
+
+PASSWORD = "bench-password"
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+
+BATCH_SIZE = 50000
+
+# Events are spread over this window, so date-range queries hit both
+# past and upcoming rows
+FIRST_EVENT_DATE = date(2020, 1, 1)
+EVENT_DAYS = 3650
+
+# How SQLAlchemy's SQLite DateTime type stores values
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def create_schema(path):
+    """Create the tables through SQLAlchemy, then hand back the index DDL.
+
+    Secondary indexes and the FTS, stats and change log triggers are
+    dropped before loading and recreated afterwards; building them once
+    over sorted data is much faster than maintaining them row by row. The
+    generated rows are the baseline, so the change log starts out empty.
+    """
+    engine = create_engine("sqlite:///" + path)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        indexes = [sql for (sql,) in conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        ))]
+        for (name,) in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+        )).fetchall():
+            kind = "TRIGGER" if name.startswith(("event_fts_", "user_event_stats_", "change_log_")) else "INDEX"
+            conn.execute(text("DROP %s %s" % (kind, name)))
+    engine.dispose()
+    return indexes
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def user_rows(count, password_hash, rng):
+    for i in range(1, count + 1):
+        yield (i, "user%d" % i, "user%d@example.com" % i, password_hash,
+               rng.random() < 0.9, rng.random() < 0.01, 1)
+
+
+def event_rows(count, users, vocabulary, rng):
+    for i in range(1, count + 1):
+        yield (
+            i,
+            " ".join(rng.choices(vocabulary, k=4)),
+            " ".join(rng.choices(vocabulary, k=20)),
+            (FIRST_EVENT_DATE + timedelta(days=rng.randrange(EVENT_DAYS))).isoformat(),
+            rng.randint(1, users),
+            1,
+        )
+
+
+def token_rows(count, rng, now):
+    # About a third already expired, so the purger has work to do
+    for i in range(1, count + 1):
+        created_at = now - timedelta(seconds=rng.randrange(6 * 3600))
+        yield (i, uuid.UUID(int=rng.getrandbits(128)).hex, created_at.strftime(DATETIME_FORMAT),
+               (created_at + timedelta(hours=2)).strftime(DATETIME_FORMAT))
+
+
+def load(path, tables):
+    conn = sqlite3.connect(path, isolation_level=None)
+    # Scratch database: skip the journal and fsyncs entirely
+    for pragma in ("journal_mode = OFF", "synchronous = OFF", "cache_size = -256000", "temp_store = MEMORY"):
+        conn.execute("PRAGMA " + pragma)
+
+    counts = {}
+    for name, sql, rows in tables:
+        started = time.perf_counter()
+        counts[name] = 0
+        conn.execute("BEGIN")
+        for batch in batches(rows):
+            conn.executemany(sql, batch)
+            counts[name] += len(batch)
+        conn.execute("COMMIT")
+        counts[name + "_seconds"] = round(time.perf_counter() - started, 2)
+    return conn, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="path of the SQLite file to create")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--hash-method", default=DEFAULT_HASH_METHOD,
+                        help="werkzeug method for the shared password hash")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="overwrite an existing file")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        if not args.force:
+            parser.error("%s already exists, pass --force to overwrite it" % args.database)
+        os.remove(args.database)
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    # Hashing once keeps generation fast; every user shares it
+    password_hash = generate_password_hash(PASSWORD, args.hash_method)
+
+    started = time.perf_counter()
+    indexes = create_schema(args.database)
+    conn, counts = load(args.database, [
+        ("users", "INSERT INTO user (id, username, email, password, is_approved, is_admin, version) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)", user_rows(args.users, password_hash, rng)),
+        ("events", "INSERT INTO event (id, title, description, event_date, user_id, version) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", event_rows(args.events, args.users, vocabulary, rng)),
+        ("tokens", "INSERT INTO token_blocklist (id, jti, created_at, expires_at) VALUES (?, ?, ?, ?)",
+         token_rows(args.tokens, rng, datetime.now(timezone.utc))),
+    ])
+
+    index_started = time.perf_counter()
+    for sql in indexes:
+        conn.execute(sql)
+    for sql in SEARCH_DDL[1:]:
+        conn.execute(sql)
+    conn.execute("INSERT INTO event_fts(event_fts) VALUES ('rebuild')")
+    for sql in STATS_DDL:
+        conn.execute(sql)
+    for sql in REBUILD_SQL:
+        conn.execute(sql, {"today": stats_today()})
+    for sql in CHANGES_DDL:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.close()
+    counts["index_seconds"] = round(time.perf_counter() - index_started, 2)
+
+    print(json.dumps(dict(
+        counts,
+        database=args.database,
+        seed=args.seed,
+        password=PASSWORD,
+        total_seconds=round(time.perf_counter() - started, 2),
+        size_mb=round(os.path.getsize(args.database) / 1e6, 1),
+    ), indent=2))
+
+
+if __name__ == "__main__":
+    main()
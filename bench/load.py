@@ -0,0 +1,446 @@
+"""Drive every API endpoint with a fixed workload mix and report latency.
+
+Runs against a database made by bench.dataset and prints throughput and
+p50/p95/p99 latency per endpoint as JSON, so runs can be diffed:
+
+    python -m bench.dataset bench.db --users 100000 --events 5000000
+    python -m bench.load bench.db --requests 20000 --concurrency 16 --output before.json
+
+By default the database is copied to a temporary file and served by a
+threaded werkzeug server in this process, so the writes in the mix never
+change the dataset between runs. With --url the requests go to a server
+that is already running on that dataset and shares the app's JWT secret.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from bench.dataset import EVENT_DAYS, FIRST_EVENT_DATE, PASSWORD
+
+BULK_SIZE = 100
+
+
+class Run:
+    """State shared by the workers: dataset bounds, search words and tokens."""
+
+    def __init__(self, database, mint_token):
+        conn = sqlite3.connect(database)
+        self.max_user_id = conn.execute("SELECT max(id) FROM user").fetchone()[0] or 0
+        self.max_event_id = conn.execute("SELECT max(id) FROM event").fetchone()[0] or 0
+        words = set()
+        for (title,) in conn.execute("SELECT title FROM event ORDER BY id LIMIT 200"):
+            words.update(title.split())
+        self.words = sorted(words) or ["event"]
+        conn.close()
+        if not self.max_user_id:
+            raise SystemExit("%s has no users; generate it with bench.dataset first" % database)
+
+        self.mint_token = mint_token
+        self.names = itertools.count()
+
+    def user_id(self, rng):
+        return rng.randint(1, self.max_user_id)
+
+    def event_id(self, rng):
+        return rng.randint(1, self.max_event_id)
+
+    def auth(self, user_id):
+        return {"Authorization": "Bearer " + self.mint_token(user_id)}
+
+    def unique_name(self, prefix):
+        return "%s-%d-%d" % (prefix, os.getpid(), next(self.names))
+
+
+def event_body(run, rng):
+    return {
+        "title": " ".join(rng.choices(run.words, k=3)),
+        "description": " ".join(rng.choices(run.words, k=12)),
+        "event_date": (FIRST_EVENT_DATE + timedelta(days=rng.randrange(EVENT_DAYS))).isoformat(),
+        "user_id": run.user_id(rng),
+    }
+
+
+def remember(pool, *keys):
+    """Response callback that stores the id found under `keys` in `pool`."""
+    def callback(body):
+        for key in keys:
+            body = body[key]
+        pool.append(body)
+    return callback
+
+
+# Each operation returns (method, path, json body, headers, callback), or None
+# when there is no row of this worker's to act on yet. The callback gets the
+# decoded JSON of a 2xx response.
+def op_fetch_users(run, worker):
+    return "GET", "/users?limit=50&after=%d" % worker.rng.randint(0, run.max_user_id), None, {}, None
+
+
+def op_user_stats(run, worker):
+    return "GET", "/users/stats?limit=50&after=%d" % worker.rng.randint(0, run.max_user_id), None, {}, None
+
+
+def op_get_user(run, worker):
+    return "GET", "/user/%d" % run.user_id(worker.rng), None, {}, None
+
+
+def op_create_user(run, worker):
+    name = run.unique_name("load-user")
+    body = {"username": name, "email": name + "@example.com", "password": PASSWORD}
+    return "POST", "/user", body, {}, remember(worker.created_users, "user", "id")
+
+
+def op_update_user(run, worker):
+    if not worker.created_users:
+        return None
+    user_id = worker.created_users[-1]
+    return "PUT", "/user/%d" % user_id, {"username": run.unique_name("load-renamed")}, {}, None
+
+
+def op_delete_user(run, worker):
+    if not worker.created_users:
+        return None
+    user_id = worker.created_users.popleft()
+    return "DELETE", "/user/%d" % user_id, None, {}, None
+
+
+def op_create_event(run, worker):
+    return "POST", "/event", event_body(run, worker.rng), {}, remember(worker.created_events, "event", "id")
+
+
+def op_create_events_bulk(run, worker):
+    return "POST", "/events/bulk", [event_body(run, worker.rng) for _ in range(BULK_SIZE)], {}, None
+
+
+def op_list_events(run, worker):
+    start = FIRST_EVENT_DATE + timedelta(days=worker.rng.randrange(EVENT_DAYS))
+    return "GET", "/events?user_id=%d&from=%s&to=%s" % (
+        run.user_id(worker.rng), start.isoformat(), (start + timedelta(days=365)).isoformat()
+    ), None, {}, None
+
+
+def op_search_events(run, worker):
+    return "GET", "/events/search?q=%s" % worker.rng.choice(run.words), None, {}, None
+
+
+def op_get_event(run, worker):
+    return "GET", "/event/%d" % run.event_id(worker.rng), None, {}, None
+
+
+def op_get_user_events(run, worker):
+    return "GET", "/user/%d/events" % run.user_id(worker.rng), None, {}, None
+
+
+def op_sync_changes(run, worker):
+    # Each worker is one client following the feed from where it got to
+    def advance(body):
+        worker.changes_since = body["next_since"]
+    return "GET", "/changes?since=%d&limit=100" % worker.changes_since, None, {}, advance
+
+
+def op_update_event(run, worker):
+    body = {"title": " ".join(worker.rng.choices(run.words, k=3))}
+    return "PUT", "/event/%d" % run.event_id(worker.rng), body, {}, None
+
+
+def op_delete_event(run, worker):
+    if not worker.created_events:
+        return None
+    event_id = worker.created_events.popleft()
+    return "DELETE", "/event/%d" % event_id, None, {}, None
+
+
+def op_register(run, worker):
+    name = run.unique_name("load-register")
+    return "POST", "/register", {"username": name, "email": name + "@example.com", "password": PASSWORD}, {}, None
+
+
+def op_login(run, worker):
+    return "POST", "/login", {"email": "user%d@example.com" % run.user_id(worker.rng), "password": PASSWORD}, {}, None
+
+
+def op_current_user(run, worker):
+    return "GET", "/current_user", None, run.auth(run.user_id(worker.rng)), None
+
+
+def op_update_password(run, worker):
+    if not worker.created_users:
+        return None
+    user_id = worker.created_users[-1]
+    body = {"old_password": PASSWORD, "new_password": PASSWORD}
+    return "PUT", "/user/updatepassword", body, run.auth(user_id), None
+
+
+def op_logout(run, worker):
+    return "POST", "/logout", None, run.auth(run.user_id(worker.rng)), None
+
+
+def op_delete_account(run, worker):
+    if not worker.created_users:
+        return None
+    user_id = worker.created_users.popleft()
+    return "DELETE", "/user/delete_account", None, run.auth(user_id), None
+
+
+# Name -> (weight, operation). Reads dominate, as they do in production;
+# every route in views/ appears at least once.
+WORKLOAD = {
+    "get_event": (20, op_get_event),
+    "get_user": (15, op_get_user),
+    "list_events": (10, op_list_events),
+    "get_user_events": (10, op_get_user_events),
+    "search_events": (8, op_search_events),
+    "create_event": (8, op_create_event),
+    "fetch_users": (5, op_fetch_users),
+    "user_stats": (2, op_user_stats),
+    "sync_changes": (2, op_sync_changes),
+    "current_user": (5, op_current_user),
+    "update_event": (5, op_update_event),
+    "create_user": (3, op_create_user),
+    "delete_event": (2, op_delete_event),
+    "update_user": (2, op_update_user),
+    "login": (2, op_login),
+    "create_events_bulk": (1, op_create_events_bulk),
+    "delete_user": (1, op_delete_user),
+    "register": (1, op_register),
+    "update_password": (1, op_update_password),
+    "logout": (1, op_logout),
+    "delete_account": (1, op_delete_account),
+}
+
+# What to run instead when an operation has no row to act on yet
+FALLBACKS = {
+    "update_user": "create_user",
+    "delete_user": "create_user",
+    "update_password": "create_user",
+    "delete_account": "create_user",
+    "delete_event": "create_event",
+}
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(latencies, seconds):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / seconds, 1) if seconds else None,
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else None,
+        "p50_ms": round(percentile(ordered, 0.50), 3) if ordered else None,
+        "p95_ms": round(percentile(ordered, 0.95), 3) if ordered else None,
+        "p99_ms": round(percentile(ordered, 0.99), 3) if ordered else None,
+        "max_ms": round(ordered[-1], 3) if ordered else None,
+    }
+
+
+class Worker(threading.Thread):
+    """Sends requests over one keep-alive connection until the run is done.
+
+    Rows a worker creates are only updated and deleted by that worker, so
+    workers never race each other on the same row.
+    """
+
+    def __init__(self, index, url, run, tickets, seed, workload=WORKLOAD):
+        super().__init__(name="load-%d" % index, daemon=True)
+        self.url = urlsplit(url)
+        self.run_state = run
+        self.tickets = tickets
+        self.rng = random.Random(seed * 1000 + index)
+        self.workload = workload
+        self.names = list(workload)
+        self.weights = [workload[name][0] for name in self.names]
+        self.samples = []  # (name, status, milliseconds)
+        self.created_users = deque()
+        self.created_events = deque()
+        self.changes_since = 0
+        self.conn = None
+
+    def connect(self):
+        self.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=60)
+
+    def send(self, method, path, body, headers):
+        if self.conn is None:
+            self.connect()
+        payload = None
+        headers = dict(headers)
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        self.conn.request(method, self.url.path.rstrip("/") + path, payload, headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.will_close:
+            self.conn.close()
+            self.conn = None
+        return response.status, data
+
+    def run(self):
+        for measured in self.tickets:
+            name = self.rng.choices(self.names, self.weights)[0]
+            request = self.workload[name][1](self.run_state, self)
+            if request is None:
+                name = FALLBACKS[name]
+                request = WORKLOAD[name][1](self.run_state, self)
+            method, path, body, headers, callback = request
+            started = time.perf_counter()
+            try:
+                status, data = self.send(method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                status, data = 0, b""
+            elapsed = (time.perf_counter() - started) * 1000
+            if measured:
+                self.samples.append((name, status, elapsed))
+            if callback is not None and 200 <= status < 300:
+                callback(json.loads(data))
+
+
+class Tickets:
+    """Hands out `warmup` unmeasured then `requests` measured request slots.
+
+    Shared by all workers; `measure_started` is set when the first measured
+    slot is taken, so warm-up time stays out of the throughput figures.
+    """
+
+    def __init__(self, warmup, requests):
+        self.flags = itertools.chain(itertools.repeat(False, warmup), itertools.repeat(True, requests))
+        self.measure_started = None
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            measured = next(self.flags)
+            if measured and self.measure_started is None:
+                self.measure_started = time.perf_counter()
+            return measured
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve(app):
+    """Start a threaded werkzeug server for `app` on a free port, returning its URL."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, name="load-server", daemon=True).start()
+    return "http://127.0.0.1:%d" % server.server_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="SQLite file made by bench.dataset")
+    parser.add_argument("--url", help="benchmark a running server instead of serving in-process")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--profile", default="sqlite-wal", help="DATABASE_PROFILE for the in-process server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    scratch = None
+    database = os.path.abspath(args.database)
+    if not args.url:
+        scratch = tempfile.mkdtemp(prefix="load-bench-")
+        database = shutil.copy(database, os.path.join(scratch, "load.db"))
+        # The app reads these at import time
+        os.environ["DATABASE_URL"] = "sqlite:///" + database
+        os.environ["DATABASE_PROFILE"] = args.profile
+
+    from flask_jwt_extended import create_access_token
+    from app import app
+
+    def mint_token(user_id):
+        with app.app_context():
+            return create_access_token(identity=str(user_id))
+
+    run = Run(database, mint_token)
+    url = args.url or serve(app)
+
+    tickets = Tickets(args.warmup, args.requests)
+    workers = [Worker(i, url, run, tickets, args.seed) for i in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - tickets.measure_started if tickets.measure_started else 0.0
+
+    samples = [sample for worker in workers for sample in worker.samples]
+    endpoints = {}
+    for name in WORKLOAD:
+        mine = [sample for sample in samples if sample[0] == name]
+        statuses = Counter(status for _, status, _ in mine)
+        endpoints[name] = dict(
+            summarize([elapsed for _, _, elapsed in mine], seconds),
+            weight=WORKLOAD[name][0],
+            errors=sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+            statuses={str(status): count for status, count in sorted(statuses.items())},
+        )
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "url": args.url or "in-process",
+        "dataset": {"users": run.max_user_id, "events": run.max_event_id},
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "seed": args.seed,
+        "seconds": round(seconds, 2),
+        "total": dict(
+            summarize([elapsed for _, _, elapsed in samples], seconds),
+            errors=sum(endpoint["errors"] for endpoint in endpoints.values()),
+        ),
+        "endpoints": endpoints,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Check every user, event and auth route against a SQL statement budget.
+
+Each route is called against a small and a larger seeded database. A route
+fails if it issues more statements than its budget, or if its statement
+count grows with the number of rows (the signature of an N+1 query).
+Routes on the blueprints that have no declared budget fail too, so new
+endpoints can't skip the check.
+
+    python -m bench.query_budgets
+
+Exits with status 1 if any route fails.
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+# The app reads its database URL at import time
+_tmpdir = tempfile.mkdtemp(prefix="query-budgets-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmpdir, "budgets.db")
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import app  # noqa: E402
+from blocklist import revocation_cache  # noqa: E402
+from cache import entity_cache  # noqa: E402
+from hashing import password_hasher  # noqa: E402
+from models import db, Event, User  # noqa: E402
+from lookup import LOOKUP_CHUNK_SIZE  # noqa: E402
+from views.event import BULK_CHUNK_SIZE  # noqa: E402
+
+BLUEPRINTS = ("user_bp", "event_bp", "auth_bp", "changes_bp")
+
+# (users, events per user) for the two runs
+SMALL = (3, 2)
+LARGE = (30, 20)
+
+PASSWORD = "budget-password"
+
+EVENT_BODY = {"title": "Budget", "description": "Query budget check", "event_date": "2030-01-01"}
+
+
+def ids(count):
+    # Multi-gets ask for every seeded row, up to one IN chunk
+    return list(range(1, min(count, LOOKUP_CHUNK_SIZE) + 1))
+
+
+def token(ctx, key="user_id"):
+    with app.app_context():
+        return {"Authorization": "Bearer " + create_access_token(identity=str(ctx[key]))}
+
+
+# endpoint -> list of (label, budget, build request). Order matters: requests
+# run top to bottom against the same data, so destructive ones come last.
+BUDGETS = {
+    "user_bp.fetch_users": [
+        ("page", 2, lambda ctx: ("GET", "/users?limit=50", {})),
+        ("stream", 2, lambda ctx: ("GET", "/users?stream=true", {})),
+        ("ids", 2, lambda ctx: ("GET", "/users?ids=" + ",".join(map(str, ids(ctx["users"]))), {})),
+    ],
+    "user_bp.lookup_users": [
+        ("lookup", 2, lambda ctx: ("POST", "/users/lookup", {"json": {"ids": ids(ctx["users"])}})),
+    ],
+    "user_bp.user_event_stats": [
+        # The first request of a day also moves that day's events to past
+        ("roll", 5, lambda ctx: ("GET", "/users/stats", {})),
+        ("page", 3, lambda ctx: ("GET", "/users/stats", {})),
+    ],
+    "user_bp.get_user": [
+        ("get", 2, lambda ctx: ("GET", "/user/%d" % ctx["user_id"], {})),
+    ],
+    "user_bp.create_user": [
+        ("create", 4, lambda ctx: ("POST", "/user", {"json": {
+            "username": "new-user", "email": "new-user@example.com", "password": PASSWORD}})),
+    ],
+    "user_bp.update_user": [
+        ("update", 4, lambda ctx: ("PUT", "/user/%d" % ctx["user_id"], {"json": {"username": "renamed"}})),
+    ],
+    "event_bp.list_events": [
+        ("range", 1, lambda ctx: ("GET", "/events?user_id=%d&from=2020-01-01&to=2040-01-01" % ctx["user_id"], {})),
+        ("ids", 1, lambda ctx: ("GET", "/events?ids=" + ",".join(map(str, ids(ctx["rows"]))), {})),
+    ],
+    "event_bp.lookup_events": [
+        ("lookup", 1, lambda ctx: ("POST", "/events/lookup", {"json": {"ids": ids(ctx["rows"])}})),
+    ],
+    "event_bp.search_events_view": [
+        ("search", 1, lambda ctx: ("GET", "/events/search?q=seeded", {})),
+    ],
+    "event_bp.get_event": [
+        ("get", 2, lambda ctx: ("GET", "/event/%d" % ctx["event_id"], {})),
+    ],
+    "event_bp.get_user_events": [
+        ("list", 2, lambda ctx: ("GET", "/user/%d/events" % ctx["user_id"], {})),
+        ("stream", 2, lambda ctx: ("GET", "/user/%d/events?stream=true" % ctx["user_id"], {})),
+    ],
+    "event_bp.create_event": [
+        ("create", 2, lambda ctx: ("POST", "/event", {"json": dict(EVENT_BODY, user_id=ctx["user_id"])})),
+    ],
+    "event_bp.create_events_bulk": [
+        # The payload grows with the dataset (up to one commit chunk) so
+        # per-row statements show up
+        ("bulk", 1, lambda ctx: ("POST", "/events/bulk", {"json": [dict(EVENT_BODY, user_id=ctx["user_id"])] * min(
+            ctx["rows"], BULK_CHUNK_SIZE)})),
+    ],
+    "event_bp.update_event": [
+        ("update", 3, lambda ctx: ("PUT", "/event/%d" % ctx["event_id"], {"json": {"title": "Renamed"}})),
+    ],
+    "auth_bp.register_user": [
+        ("register", 2, lambda ctx: ("POST", "/register", {"json": {
+            "username": "registered", "email": "registered@example.com", "password": PASSWORD}})),
+    ],
+    "auth_bp.login": [
+        ("login", 1, lambda ctx: ("POST", "/login", {"json": {"email": ctx["email"], "password": PASSWORD}})),
+    ],
+    "auth_bp.current_user": [
+        # Blocklist check, then the version and row reads of get_user
+        ("current", 3, lambda ctx: ("GET", "/current_user", {"headers": token(ctx)})),
+    ],
+    "auth_bp.update_password": [
+        ("update", 3, lambda ctx: ("PUT", "/user/updatepassword", {"headers": token(ctx), "json": {
+            "old_password": PASSWORD, "new_password": PASSWORD}})),
+    ],
+    "auth_bp.logout": [
+        ("logout", 2, lambda ctx: ("POST", "/logout", {"headers": token(ctx)})),
+    ],
+    "changes_bp.list_changes": [
+        ("all", 2, lambda ctx: ("GET", "/changes?since=0&limit=100", {})),
+        ("user", 2, lambda ctx: ("GET", "/changes?since=0&user_id=%d" % ctx["user_id"], {})),
+    ],
+    "event_bp.stream_events": [
+        # Subscribing touches no table; only the first message is read
+        ("stream", 0, lambda ctx: ("GET", "/events/stream?user_id=%d" % ctx["user_id"], {})),
+    ],
+    "event_bp.delete_event": [
+        ("delete", 2, lambda ctx: ("DELETE", "/event/%d" % ctx["event_id"], {})),
+    ],
+    "auth_bp.delete_account": [
+        ("delete", 4, lambda ctx: ("DELETE", "/user/delete_account", {"headers": token(ctx, "account_user_id")})),
+    ],
+    "user_bp.delete_user": [
+        ("delete", 3, lambda ctx: ("DELETE", "/user/%d" % ctx["other_user_id"], {})),
+    ],
+}
+
+
+def seed(users, events_per_user):
+    """Recreate the schema and fill it, returning ids the requests refer to."""
+    db.drop_all()
+    db.create_all()
+
+    password = password_hasher.hash(PASSWORD)
+    db.session.execute(insert(User), [
+        {"username": "user%d" % i, "email": "user%d@example.com" % i, "password": password}
+        for i in range(users)
+    ])
+    # The delete cases get accounts of their own, with as many events as the rest
+    db.session.execute(insert(User), [
+        {"username": name, "email": name + "@example.com", "password": password}
+        for name in ("account-delete", "admin-delete")
+    ])
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    db.session.execute(insert(Event), [
+        {"title": "Seeded %d" % i, "description": "seeded event", "event_date": date(2030, 1, 1 + i % 28),
+         "user_id": user_id}
+        for user_id in user_ids for i in range(events_per_user)
+    ])
+    db.session.commit()
+
+    ids = dict(db.session.query(User.username, User.id).filter(User.username.like("%-delete")))
+    return {
+        "users": users,
+        "rows": users * events_per_user,
+        "user_id": user_ids[0],
+        "account_user_id": ids["account-delete"],
+        "other_user_id": ids["admin-delete"],
+        "email": "user0@example.com",
+        "event_id": db.session.query(Event.id).filter_by(user_id=user_ids[0]).first()[0],
+    }
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def run(size, counter):
+    """Run every declared request once, returning {(endpoint, label): (status, statements)}."""
+    with app.app_context():
+        ctx = seed(*size)
+        # The revocation filter is built once per worker; budgets cover the
+        # sync every request makes after that
+        revocation_cache.is_revoked("warm-up")
+
+    client = app.test_client()
+    results = {}
+    for endpoint, cases in BUDGETS.items():
+        for label, _, build in cases:
+            method, url, kwargs = build(ctx)
+            # Measure the cold path: nothing cached from earlier requests
+            entity_cache.backend.clear()
+            counter.count = 0
+            response = client.open(url, method=method, **kwargs)
+            if response.mimetype == "text/event-stream":
+                # Never ends; closing it unsubscribes
+                next(iter(response.response))
+            else:
+                response.get_data()
+            response.close()
+            results[(endpoint, label)] = (response.status_code, counter.count)
+    return results
+
+
+def main():
+    # Cheap hashes and a revocation check that always syncs, so counts are
+    # deterministic and the run takes seconds
+    password_hasher.method = "pbkdf2:sha256:1000"
+    revocation_cache.resync_seconds = 0
+
+    counter = StatementCounter()
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", counter)
+
+    small = run(SMALL, counter)
+    large = run(LARGE, counter)
+
+    failures = []
+    declared = set(BUDGETS)
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split(".")[0] in BLUEPRINTS and rule.endpoint not in declared:
+            failures.append("%s: no query budget declared" % rule.endpoint)
+
+    print("%-32s %-8s %6s %6s %6s  %s" % ("endpoint", "case", "small", "large", "budget", "status"))
+    for endpoint, cases in BUDGETS.items():
+        for label, budget, _ in cases:
+            small_status, small_count = small[(endpoint, label)]
+            large_status, large_count = large[(endpoint, label)]
+            problems = []
+            if small_status >= 500 or large_status >= 500:
+                problems.append("server error %d/%d" % (small_status, large_status))
+            if max(small_count, large_count) > budget:
+                problems.append("over budget")
+            if large_count > small_count:
+                problems.append("grows with rows (N+1)")
+            print("%-32s %-8s %6d %6d %6d  %s" % (
+                endpoint, label, small_count, large_count, budget, ", ".join(problems) or "ok"))
+            failures.extend("%s [%s]: %s" % (endpoint, label, problem) for problem in problems)
+
+    if failures:
+        print("\n%d failure(s):" % len(failures))
+        for failure in failures:
+            print("  " + failure)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Compare the FTS5 event search with a naive LIKE scan.
+
+Builds a scratch SQLite database of synthetic events, runs the same word
+queries through both approaches and prints the timings as JSON:
+
+    python -m bench.search_bench --events 200000 --queries 50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from models import db
+from search import SEARCH_SQL, match_expression  # also registers the FTS5 DDL
+
+LIKE_SQL = (
+    "SELECT event.* FROM event "
+    "WHERE event.title LIKE :pattern OR event.description LIKE :pattern "
+    "ORDER BY event.id LIMIT :limit"
+)
+
+
+def make_vocabulary(rng, size):
+    syllables = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "ve", "zu", "an", "el", "or"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def populate(engine, rng, vocabulary, count):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO user (id, username, email, password) VALUES (1, 'bench', 'bench@example.com', 'x')"
+        ))
+        batch = []
+        for i in range(count):
+            batch.append({
+                "title": " ".join(rng.choices(vocabulary, k=4)),
+                "description": " ".join(rng.choices(vocabulary, k=20)),
+                "event_date": "2025-01-01",
+            })
+            if len(batch) == 10000 or i == count - 1:
+                conn.execute(text(
+                    "INSERT INTO event (title, description, event_date, user_id) "
+                    "VALUES (:title, :description, :event_date, 1)"
+                ), batch)
+                batch = []
+
+
+def time_queries(engine, sql, params_list):
+    timings = []
+    with engine.connect() as conn:
+        for params in params_list:
+            started = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    words = rng.sample(vocabulary, args.queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine("sqlite:///" + os.path.join(tmp, "bench.db"))
+
+        started = time.perf_counter()
+        populate(engine, rng, vocabulary, args.events)
+        load_seconds = time.perf_counter() - started
+
+        like = time_queries(engine, LIKE_SQL, [
+            {"pattern": "%" + word + "%", "limit": args.limit} for word in words
+        ])
+        fts = time_queries(engine, SEARCH_SQL, [
+            {"query": match_expression(word), "limit": args.limit, "offset": 0} for word in words
+        ])
+        engine.dispose()
+
+    print(json.dumps({
+        "events": args.events,
+        "queries": args.queries,
+        "load_seconds": round(load_seconds, 2),
+        "like": like,
+        "fts5": fts,
+        "speedup_p50": round(like["p50_ms"] / fts["p50_ms"], 1) if fts["p50_ms"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Compare ORM-object serialization with the plain-row serializers.
+
+Runs the queries behind /users, /user/<id>/events and the single-item
+getters against a database made by bench.dataset, once by loading ORM
+objects and copying their attributes into dicts (how the views used to
+work) and once through serializers.RowSerializer, and prints rows
+serialized per second for each as JSON:
+
+    python -m bench.dataset bench.db --users 2000 --events 200000
+    python -m bench.serialize_bench bench.db --repeat 5
+
+Only the query and the dict building are timed; the JSON encoding is the
+same for both paths and is left out.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def timed(repeat, run):
+    """Best rows/s over `repeat` runs of `run`, which returns the rows it serialized."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = run()
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return {"rows": rows, "best_seconds": round(best, 4), "rows_per_second": round(rows / best) if best else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="SQLite file made by bench.dataset")
+    parser.add_argument("--users", type=int, default=500, help="users per /users page")
+    parser.add_argument("--gets", type=int, default=2000, help="single-item reads per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(args.database)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import selectinload
+
+    from app import app
+    from models import db, Event, User
+    from serializers import serializer
+    from views.event import EVENT_FIELDS, USER_EVENT_FIELDS, event_to_dict, user_event_to_dict
+    from views.user import USER_FIELDS, USER_LIST_FIELDS, _serialize_users, listed_user_to_dict, user_to_dict
+
+    with app.app_context():
+        # The user with the most events, so the per-user list is as long as it gets
+        busiest = db.session.execute(
+            select(Event.user_id).group_by(Event.user_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        max_user = db.session.scalar(select(func.max(User.id)))
+        max_event = db.session.scalar(select(func.max(Event.id)))
+        user_ids = [1 + i * max_user // args.gets for i in range(args.gets)]
+        event_ids = [1 + i * max_event // args.gets for i in range(args.gets)]
+
+        def session_run(work):
+            # A fresh session per run, as every request gets
+            def run():
+                try:
+                    return work()
+                finally:
+                    db.session.remove()
+            return run
+
+        # /users: a page of users with their events
+        def users_orm():
+            users = db.session.scalars(
+                select(User).options(selectinload(User.events)).order_by(User.id).limit(args.users)
+            ).all()
+            data = [listed_user_to_dict(user) for user in users]
+            return len(data) + sum(len(user["events"]) for user in data)
+
+        def users_rows():
+            to_user = serializer(User, USER_LIST_FIELDS[:-1], ("id",))
+            rows = db.session.execute(to_user.select().order_by(User.id).limit(args.users)).all()
+            data = _serialize_users(rows, USER_LIST_FIELDS, to_user)
+            return len(data) + sum(len(user["events"]) for user in data)
+
+        # /user/<id>/events
+        def user_events_orm():
+            events = db.session.scalars(
+                select(Event).filter_by(user_id=busiest).order_by(Event.id)
+            ).all()
+            return len([user_event_to_dict(event) for event in events])
+
+        def user_events_rows():
+            to_event = serializer(Event, USER_EVENT_FIELDS)
+            query = to_event.select().where(Event.user_id == busiest).order_by(Event.id)
+            return len([to_event(row) for row in db.session.execute(query)])
+
+        # /user/<id> and /event/<id> cache misses
+        def getters_orm():
+            for user_id in user_ids:
+                user = db.session.get(User, user_id)
+                if user:
+                    user_to_dict(user)
+            for event_id in event_ids:
+                event = db.session.get(Event, event_id)
+                if event:
+                    event_to_dict(event)
+            return len(user_ids) + len(event_ids)
+
+        def getters_rows():
+            to_user = serializer(User, USER_FIELDS)
+            to_event = serializer(Event, EVENT_FIELDS)
+            for user_id in user_ids:
+                to_user.get(db.session, user_id)
+            for event_id in event_ids:
+                to_event.get(db.session, event_id)
+            return len(user_ids) + len(event_ids)
+
+        report = {"database": args.database, "busiest_user_id": busiest, "cases": {}}
+        for name, orm, rows in (
+            ("fetch_users", users_orm, users_rows),
+            ("get_user_events", user_events_orm, user_events_rows),
+            ("single_getters", getters_orm, getters_rows),
+        ):
+            # One untimed pass each warms the page cache and the statement caches
+            session_run(orm)()
+            session_run(rows)()
+            before = timed(args.repeat, session_run(orm))
+            after = timed(args.repeat, session_run(rows))
+            report["cases"][name] = {
+                "orm": before,
+                "rows": after,
+                "speedup": round(after["rows_per_second"] / before["rows_per_second"], 2),
+            }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Measure how many /events/stream subscribers one worker can hold.
+
+Serves a copy of a bench.dataset database with each app in its own
+process: app.py on werkzeug with a thread per connection (a streamed
+response holds its thread for as long as the client stays), asgi.py on
+uvicorn. At each step the number of connected subscribers is raised,
+each following one of --users users, and the server's resident memory
+and thread count are read while they sit idle. Then --events events are
+created through the API and the time until every matching subscriber has
+each one is recorded:
+
+    python -m bench.stream_bench bench.db --levels 100,1000,4000
+
+The report says, per server, the most subscribers held with every
+connection accepted, every message delivered and p99 delivery latency
+within --p99-ms. Memory and threads are read from /proc, so this runs on
+Linux only.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.load import git_revision, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGE = re.compile(rb"event: create\ndata: (\{[^\n]*\})\n\n")
+
+EVENT_BODY = {"title": "Stream bench", "description": "Fan-out check", "event_date": "2030-01-01"}
+
+
+def serve_wsgi(port, heartbeat):
+    """Run app.py with a thread per connection; used as this module's --serve-wsgi mode."""
+    from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+    from app import app
+    from broker import event_broker
+
+    # Short heartbeats, so threads of clients that left are freed between steps
+    event_broker.heartbeat = heartbeat
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = ThreadedWSGIServer("127.0.0.1", port, app, handler=QuietHandler)
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def start_server(kind, database, port, heartbeat):
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + database, LOG_LEVEL="WARNING")
+    if kind == "wsgi":
+        command = [sys.executable, "-m", "bench.stream_bench", "--serve-wsgi", str(port),
+                   "--heartbeat", str(heartbeat)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--backlog", "4096",
+                   "--no-access-log", "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/user/1")
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("%s server did not start" % kind)
+
+
+def process_status(pid):
+    """Resident memory in MB and thread count of `pid`, from /proc."""
+    status = {}
+    with open("/proc/%d/status" % pid) as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.split()
+    return int(status["VmRSS"][0]) / 1024, int(status["Threads"][0])
+
+
+class Subscribers:
+    """Holds many stream connections on one thread, recording when each message arrives."""
+
+    def __init__(self, port, count, users):
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        self.subscribed = set()
+        self.received = {}  # (subscriber, event id) -> arrival time
+        self.failed = 0
+        for index in range(count):
+            try:
+                sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+            except OSError:
+                self.failed += 1
+                continue
+            # HTTP/1.0, so the body comes unchunked until the server closes it
+            path = "/events/stream?user_id=%d" % (1 + index % users)
+            sock.sendall(("GET %s HTTP/1.0\r\nHost: bench\r\n\r\n" % path).encode())
+            sock.setblocking(False)
+            self.buffers[sock] = b""
+            self.selector.register(sock, selectors.EVENT_READ, index)
+
+    def pump(self, seconds):
+        """Read whatever arrives for `seconds`."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            for key, _ in self.selector.select(remaining):
+                sock, index = key.fileobj, key.data
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    data = b""
+                now = time.perf_counter()
+                if not data:
+                    self.selector.unregister(sock)
+                    sock.close()
+                    del self.buffers[sock]
+                    self.failed += 1
+                    continue
+
+                buffer = self.buffers[sock] + data
+                if index not in self.subscribed and b": subscribed" in buffer:
+                    self.subscribed.add(index)
+                end = 0
+                for found in MESSAGE.finditer(buffer):
+                    self.received[(index, json.loads(found.group(1))["id"])] = now
+                    end = found.end()
+                # Keep only what might be the start of a message
+                self.buffers[sock] = buffer[end:][-4096:]
+
+    def wait_subscribed(self, count, timeout):
+        deadline = time.monotonic() + timeout
+        while len(self.subscribed) + self.failed < count and time.monotonic() < deadline:
+            self.pump(0.05)
+
+    def close(self):
+        for sock in list(self.buffers):
+            self.selector.unregister(sock)
+            sock.close()
+        self.buffers.clear()
+        self.selector.close()
+
+
+def run_step(port, pid, count, users, events, interval, baseline):
+    subscribers = Subscribers(port, count, users)
+    started = time.perf_counter()
+    subscribers.wait_subscribed(count, timeout=max(30, count / 50))
+    connect_seconds = time.perf_counter() - started
+
+    # Let the server settle, then read what the idle connections cost
+    subscribers.pump(1.0)
+    rss_mb, threads = process_status(pid)
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    sent = {}
+    for number in range(events):
+        user_id = 1 + number % users
+        body = json.dumps(dict(EVENT_BODY, user_id=user_id))
+        published = time.perf_counter()
+        conn.request("POST", "/event", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        data = response.read()
+        if response.status == 201:
+            sent[json.loads(data)["event"]["id"]] = (user_id, published)
+        subscribers.pump(interval)
+    conn.close()
+    subscribers.pump(2.0)
+
+    latencies = []
+    expected = missed = 0
+    for index in subscribers.subscribed:
+        for event_id, (user_id, published) in sent.items():
+            if 1 + index % users != user_id:
+                continue
+            expected += 1
+            arrived = subscribers.received.get((index, event_id))
+            if arrived is None:
+                missed += 1
+            else:
+                latencies.append((arrived - published) * 1000)
+    subscribers.close()
+
+    step = summarize(latencies, 0.0)
+    step.pop("throughput_rps")
+    step["deliveries"] = step.pop("requests")
+    return dict(
+        step,
+        subscribers=count,
+        subscribed=len(subscribers.subscribed),
+        failed_connections=count - len(subscribers.subscribed),
+        connect_seconds=round(connect_seconds, 2),
+        messages_expected=expected,
+        messages_missed=missed,
+        server_rss_mb=round(rss_mb, 1),
+        server_threads=threads,
+        rss_kb_per_subscriber=round((rss_mb - baseline) * 1024 / count, 1) if count else None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", nargs="?", help="SQLite file made by bench.dataset")
+    parser.add_argument("--levels", default="100,500,1000,2000,4000", help="subscriber counts to step through")
+    parser.add_argument("--users", type=int, default=10, help="subscribers are spread over this many users")
+    parser.add_argument("--events", type=int, default=50, help="events created per step")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between created events")
+    parser.add_argument("--p99-ms", type=float, default=250.0)
+    parser.add_argument("--heartbeat", type=float, default=2.0, help="heartbeat seconds for the WSGI server")
+    parser.add_argument("--servers", default="wsgi,asgi")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--serve-wsgi", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        return serve_wsgi(args.serve_wsgi, args.heartbeat)
+    if not args.database:
+        parser.error("the database argument is required")
+
+    levels = [int(level) for level in args.levels.split(",")]
+    report = {
+        "revision": git_revision(),
+        "p99_target_ms": args.p99_ms,
+        "users": args.users,
+        "events_per_step": args.events,
+        "servers": {},
+    }
+
+    for kind in args.servers.split(","):
+        scratch = tempfile.mkdtemp(prefix="stream-bench-")
+        try:
+            database = shutil.copy(os.path.abspath(args.database), os.path.join(scratch, "bench.db"))
+            process = start_server(kind, database, args.port, args.heartbeat)
+            try:
+                baseline, _ = process_status(process.pid)
+                steps = []
+                for level in levels:
+                    steps.append(run_step(
+                        args.port, process.pid, level, args.users, args.events, args.interval, baseline
+                    ))
+                    # Give the server time to notice the closed connections
+                    time.sleep(args.heartbeat + 1)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        held = [
+            step["subscribers"] for step in steps
+            if not step["failed_connections"] and not step["messages_missed"]
+            and step["p99_ms"] is not None and step["p99_ms"] <= args.p99_ms
+        ]
+        report["servers"][kind] = {
+            "max_subscribers_within_p99": max(held) if held else 0,
+            "baseline_rss_mb": round(baseline, 1),
+            "steps": steps,
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
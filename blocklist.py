@@ -0,0 +1,269 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select
+
+from models import db, TokenBlocklist
+
+# Running totals for expired-row purges in this process
+purge_stats = {"runs": 0, "rows_deleted": 0, "seconds": 0.0, "last_run_at": None}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, backed by a bytearray."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: derive every position from two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationCache:
+    """Per-worker cache in front of the TokenBlocklist table.
+
+    Every revoked jti is loaded into a Bloom filter, so a token that was never
+    revoked is answered without touching the database. Possible hits fall back
+    to a bounded LRU of recent answers and then to an exact query. Workers share
+    a generation file that `revoke` touches; when it changes, the new rows are
+    pulled in with a single `id > last_seen` query.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("REVOCATION_BLOOM_CAPACITY", 100000)
+        app.config.setdefault("REVOCATION_BLOOM_ERROR_RATE", 0.01)
+        app.config.setdefault("REVOCATION_LRU_SIZE", 10000)
+        # Upper bound on how stale a worker can be if a generation bump is missed
+        app.config.setdefault("REVOCATION_RESYNC_SECONDS", 30)
+        app.config.setdefault(
+            "REVOCATION_GENERATION_FILE",
+            os.path.join(app.instance_path, "blocklist.generation"),
+        )
+
+        self.capacity = app.config["REVOCATION_BLOOM_CAPACITY"]
+        self.error_rate = app.config["REVOCATION_BLOOM_ERROR_RATE"]
+        self.lru_size = app.config["REVOCATION_LRU_SIZE"]
+        self.resync_seconds = app.config["REVOCATION_RESYNC_SECONDS"]
+        self.generation_file = app.config["REVOCATION_GENERATION_FILE"]
+        self._reset()
+        app.extensions["revocation_cache"] = self
+
+    def _reset(self, capacity=None):
+        self.bloom = BloomFilter(capacity or self.capacity, self.error_rate)
+        self.recent = OrderedDict()
+        self.last_seen_id = 0
+        self.loaded = False
+        self.generation = None
+        self.synced_at = 0.0
+
+    def _read_generation(self):
+        try:
+            st = os.stat(self.generation_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _bump_generation(self):
+        # Write-then-rename so readers always see a new inode and mtime
+        os.makedirs(os.path.dirname(self.generation_file), exist_ok=True)
+        tmp = "%s.%d" % (self.generation_file, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp, self.generation_file)
+
+    def _remember(self, jti, revoked):
+        self.recent[jti] = revoked
+        self.recent.move_to_end(jti)
+        if len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+
+    def _sync(self):
+        generation = self._read_generation()
+        now = time.monotonic()
+        if generation == self.generation and now - self.synced_at < self.resync_seconds:
+            return
+
+        # The filter is built on the first sync, and rebuilt once it is full
+        # and stops being selective
+        if not self._load(rebuild=not self.loaded or self.bloom.count >= self.bloom.capacity):
+            # The table's highest id is below the last one loaded, so ids
+            # have been handed out again (a table from before AUTOINCREMENT,
+            # or a restored copy) and new rows may sit below `last_seen_id`
+            self._load(rebuild=True)
+
+        self.loaded = True
+        self.generation = generation
+        self.synced_at = now
+
+    def _load(self, rebuild):
+        """Pull new rows into the filter, returning False if ids went backwards.
+
+        A rebuild starts over from the rows that haven't expired (an expired
+        token is refused before its jti is checked), in a filter sized for
+        twice that many, so it isn't full again by the next sync however
+        large the table has grown.
+        """
+        query = db.session.query(TokenBlocklist.id, TokenBlocklist.jti)
+        if rebuild:
+            now_utc = datetime.now(timezone.utc)
+            live = (
+                db.session.query(func.count(TokenBlocklist.id))
+                .filter(TokenBlocklist.expires_at >= now_utc)
+                .scalar()
+            )
+            self.queries += 1
+            self._reset(max(self.capacity, 2 * live))
+            query = query.filter(TokenBlocklist.expires_at >= now_utc)
+
+        # Starts at the highest row when that was seen already (or is below
+        # the last one seen), so the same primary key range read tells
+        # whether ids went backwards
+        start = select(func.min(func.max(TokenBlocklist.id), self.last_seen_id + 1)).scalar_subquery()
+        rows = query.filter(TokenBlocklist.id >= start).order_by(TokenBlocklist.id).all()
+        self.queries += 1
+        if not rebuild and (rows[-1][0] if rows else 0) < self.last_seen_id:
+            return False
+
+        for row_id, jti in rows:
+            if jti not in self.bloom:
+                self.bloom.add(jti)
+            self._remember(jti, True)
+            self.last_seen_id = max(self.last_seen_id, row_id)
+        return True
+
+    def is_revoked(self, jti):
+        with self._lock:
+            self._sync()
+
+            if jti not in self.bloom:
+                self.hits += 1
+                return False
+
+            if jti in self.recent:
+                self.hits += 1
+                self.recent.move_to_end(jti)
+                return self.recent[jti]
+
+            # Bloom filter false positive or a row we haven't seen yet
+            self.misses += 1
+            self.queries += 1
+            revoked = db.session.query(TokenBlocklist.id).filter_by(jti=jti).first() is not None
+            self._remember(jti, revoked)
+            return revoked
+
+    def revoke(self, jti):
+        """Record a jti that was just committed to the blocklist."""
+        with self._lock:
+            self.bloom.add(jti)
+            self._remember(jti, True)
+        self._bump_generation()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries,
+            "bloom_entries": self.bloom.count,
+            "bloom_capacity": self.bloom.capacity,
+            "lru_entries": len(self.recent),
+        }
+
+
+revocation_cache = RevocationCache()
+
+
+def blocklist_size():
+    """Return the total number of blocklist rows and how many of them have expired."""
+    now = datetime.now(timezone.utc)
+    total = db.session.query(func.count(TokenBlocklist.id)).scalar()
+    expired = db.session.query(func.count(TokenBlocklist.id)).filter(TokenBlocklist.expires_at < now).scalar()
+    return total, expired
+
+
+def purge_expired_tokens(batch_size=500, max_batches=None, pause=0.0):
+    """Delete blocklist rows for tokens that have already expired.
+
+    Rows are removed `batch_size` at a time with a commit after every batch, so
+    the SQLite write lock is only ever held for one short statement and other
+    writers (logouts) can interleave. Returns the number of rows deleted.
+    """
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    deleted = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        expired_ids = (
+            select(TokenBlocklist.id)
+            .where(TokenBlocklist.expires_at < now)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            delete(TokenBlocklist)
+            .where(TokenBlocklist.id.in_(expired_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        batches += 1
+        deleted += result.rowcount
+
+        if result.rowcount < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    purge_stats["runs"] += 1
+    purge_stats["rows_deleted"] += deleted
+    purge_stats["seconds"] += time.perf_counter() - started
+    purge_stats["last_run_at"] = now.isoformat()
+    return deleted
+
+
+def start_background_purger(app):
+    """Purge expired rows every BLOCKLIST_PURGE_INTERVAL seconds on a daemon thread."""
+    interval = app.config.get("BLOCKLIST_PURGE_INTERVAL", 0)
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    purge_expired_tokens(batch_size=app.config.get("BLOCKLIST_PURGE_BATCH_SIZE", 500))
+                except Exception:
+                    app.logger.exception("Blocklist purge failed")
+
+    thread = threading.Thread(target=run, name="blocklist-purger", daemon=True)
+    thread.start()
+    return thread
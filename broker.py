@@ -0,0 +1,198 @@
+import json
+import queue
+import threading
+import weakref
+from collections import deque
+
+
+class Subscription:
+    """One client's pending messages, optionally limited to one user's events.
+
+    The broker's dispatcher thread appends to `pending` and calls `notify`;
+    whatever serves the connection (a request thread waiting on a
+    threading.Event, or a coroutine woken through its loop) drains it. A
+    client that falls `max_pending` messages behind is marked overflowed and
+    gets nothing more; it has to reconnect and catch up from /changes.
+    """
+
+    __slots__ = ("user_id", "pending", "max_pending", "overflowed", "notify")
+
+    def __init__(self, user_id, notify, max_pending):
+        self.user_id = user_id
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.overflowed = False
+        self.notify = notify
+
+    def put(self, message):
+        """Queue `message`, returning False if that made the subscription overflow."""
+        if len(self.pending) >= self.max_pending:
+            self.overflowed = True
+            self.notify()
+            return False
+        self.pending.append(message)
+        self.notify()
+        return True
+
+    def drain(self):
+        messages = []
+        while self.pending:
+            messages.append(self.pending.popleft())
+        return messages
+
+
+class LocalBroker:
+    """Fans messages out to the subscribers in this worker.
+
+    Subscribers are indexed by the user they follow (None for everyone), so
+    a message only touches the subscribers that want it and an idle
+    subscriber costs nothing but its entry. Publishing just queues the
+    message; a dispatcher thread does the fan-out, so writers don't wait on
+    however many clients are connected.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.subscribers = {}  # user_id (or None) -> set of Subscriptions
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._dispatcher = None
+
+    def subscribe(self, user_id, notify):
+        subscription = Subscription(user_id, notify, self.max_pending)
+        with self._lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self.subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.user_id]
+
+    def publish(self, message):
+        self.published += 1
+        self._enqueue(message)
+
+    def _enqueue(self, message):
+        if self._dispatcher is None:
+            with self._lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch, name="event-broker", daemon=True)
+                    self._dispatcher.start()
+        self._queue.put(message)
+
+    def _dispatch(self):
+        while True:
+            message = self._queue.get()
+            with self._lock:
+                targets = list(self.subscribers.get(message["event"]["user_id"], ()))
+                targets.extend(self.subscribers.get(None, ()))
+            for subscription in targets:
+                if subscription.overflowed:
+                    continue
+                if subscription.put(message):
+                    self.delivered += 1
+                else:
+                    self.overflows += 1
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+
+class SharedBroker(LocalBroker):
+    """Local stand-in for a broker shared by every worker, such as Redis pub/sub.
+
+    Every instance in the process stands for one worker subscribed to the
+    same channel: a message published through any of them is serialized
+    once, the way it would cross the network, and delivered to the
+    subscribers of all of them.
+    """
+
+    _channel = weakref.WeakSet()
+    _channel_lock = threading.Lock()
+
+    def __init__(self, max_pending=100):
+        super().__init__(max_pending)
+        with SharedBroker._channel_lock:
+            SharedBroker._channel.add(self)
+
+    def publish(self, message):
+        self.published += 1
+        raw = json.dumps(message)
+        with SharedBroker._channel_lock:
+            brokers = list(SharedBroker._channel)
+        for broker in brokers:
+            broker._enqueue(json.loads(raw))
+
+
+BACKENDS = {
+    "memory": LocalBroker,
+    "shared": SharedBroker,
+}
+
+
+class EventBroker:
+    """Pushes event creates, updates and deletes to streaming clients.
+
+    The event views call `publish` after committing; /events/stream holds a
+    `subscribe`d connection per client. Messages are
+    `{"op": ..., "event": {...}}`, where deletes carry only the id and the
+    owner. Nothing is persisted: a client that was disconnected catches up
+    from /changes.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.heartbeat = 15
+        self.slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EVENT_STREAM_BROKER", "memory")
+        app.config.setdefault("EVENT_STREAM_MAX_PENDING", 100)
+        app.config.setdefault("EVENT_STREAM_HEARTBEAT", 15)
+        app.config.setdefault("EVENT_STREAM_MAX_SUBSCRIBERS", 32)
+
+        self.use_backend(app.config["EVENT_STREAM_BROKER"], app.config["EVENT_STREAM_MAX_PENDING"])
+        self.heartbeat = app.config["EVENT_STREAM_HEARTBEAT"]
+        # Each WSGI subscriber holds a request thread for as long as it stays connected
+        self.slots = threading.BoundedSemaphore(app.config["EVENT_STREAM_MAX_SUBSCRIBERS"])
+        app.extensions["event_broker"] = self
+
+    def use_backend(self, name, max_pending):
+        self.backend = BACKENDS[name](max_pending)
+
+    def publish(self, op, event):
+        self.backend.publish({"op": op, "event": event})
+
+    def subscribe(self, user_id, notify):
+        """Follow every event, or only `user_id`'s; `notify` is called from another thread."""
+        return self.backend.subscribe(user_id, notify)
+
+    def unsubscribe(self, subscription):
+        self.backend.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "subscribers": len(self.backend),
+            "published": self.backend.published,
+            "delivered": self.backend.delivered,
+            "overflows": self.backend.overflows,
+        }
+
+
+def format_message(message):
+    """Encode a broker message as a server-sent event."""
+    return "event: %s\ndata: %s\n\n" % (message["op"], json.dumps(message["event"], separators=(",", ":")))
+
+
+event_broker = EventBroker()
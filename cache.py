@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """Size-bounded LRU with a per-entry TTL, private to this worker."""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SharedBackend(MemoryBackend):
+    """Local stand-in for a shared cache server such as Redis or memcached.
+
+    Values cross a serialization boundary the way they would over the network,
+    so callers can't accidentally depend on getting the same object back, and
+    every instance in the process reads and writes the same keyspace.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_entries=10000, ttl=300):
+        with SharedBackend._shared_lock:
+            if SharedBackend._shared is None:
+                SharedBackend._shared = MemoryBackend(max_entries, ttl)
+        self.store = SharedBackend._shared
+
+    def get(self, key):
+        raw = self.store.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self.store.set(key, json.dumps(value).encode())
+
+    def delete(self, key):
+        self.store.delete(key)
+
+    def clear(self):
+        self.store.clear()
+
+    @property
+    def evictions(self):
+        return self.store.evictions
+
+    def __len__(self):
+        return len(self.store)
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "shared": SharedBackend,
+}
+
+
+class EntityCache:
+    """Read-through cache of serialized rows, keyed by model and primary key.
+
+    Views ask for `get_or_load(Model, id, loader)`; on a miss the loader runs
+    and its result is stored. Every write path calls `invalidate` for the rows
+    it changed after committing. Passing the row's current `version` also
+    turns entries written before a change in another worker into misses.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ENTITY_CACHE_BACKEND", "memory")
+        app.config.setdefault("ENTITY_CACHE_SIZE", 10000)
+        app.config.setdefault("ENTITY_CACHE_TTL", 300)
+
+        self.use_backend(
+            app.config["ENTITY_CACHE_BACKEND"], app.config["ENTITY_CACHE_SIZE"], app.config["ENTITY_CACHE_TTL"]
+        )
+        app.extensions["entity_cache"] = self
+
+    def use_backend(self, name, max_entries, ttl):
+        self.backend = BACKENDS[name](max_entries, ttl)
+
+    @staticmethod
+    def key(model, id):
+        return "%s:%s" % (model.__tablename__, id)
+
+    def _lookup(self, key, version):
+        entry = self.backend.get(key)
+        if entry is not None and (version is None or entry[0] == version):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def get_or_load(self, model, id, loader, version=None):
+        key = self.key(model, id)
+        entry = self._lookup(key, version)
+        if entry is not None:
+            return entry[1]
+
+        value = loader()
+        if value is not None:
+            self.backend.set(key, [version, value])
+        return value
+
+    async def get_or_load_async(self, model, id, loader, version=None):
+        """`get_or_load` for async callers; `loader` is a coroutine function."""
+        key = self.key(model, id)
+        entry = self._lookup(key, version)
+        if entry is not None:
+            return entry[1]
+
+        value = await loader()
+        if value is not None:
+            self.backend.set(key, [version, value])
+        return value
+
+    def invalidate(self, model, id):
+        self.backend.delete(self.key(model, id))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.backend.evictions,
+        }
+
+
+entity_cache = EntityCache()
@@ -0,0 +1,169 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import DDL, event, text
+
+from models import db, Event, User
+
+# Running totals for change log compaction in this process
+compaction_stats = {"runs": 0, "rows_expired": 0, "rows_collapsed": 0, "seconds": 0.0}
+
+_NOW = "datetime('now')"
+_LOG = "INSERT INTO change_log (entity, entity_id, user_id, op, changed_at) "
+
+# Every write to event and user appends to change_log in the writer's own
+# transaction, whichever code path made it. Password changes and version
+# bumps alone are not changes a client can see, so they aren't logged; a
+# soft delete is logged as the user's delete.
+EVENT_CHANGES_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS change_log_event_insert AFTER INSERT ON event BEGIN "
+    + _LOG + "VALUES ('event', new.id, new.user_id, 'create', " + _NOW + "); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS change_log_event_update "
+    "AFTER UPDATE OF title, description, event_date, user_id ON event BEGIN "
+    + _LOG + "VALUES ('event', new.id, new.user_id, 'update', " + _NOW + "); "
+    # Moving an event to another user removes it from the old owner's feed
+    + _LOG + "SELECT 'event', old.id, old.user_id, 'delete', " + _NOW + " WHERE old.user_id IS NOT new.user_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS change_log_event_delete AFTER DELETE ON event BEGIN "
+    + _LOG + "VALUES ('event', old.id, old.user_id, 'delete', " + _NOW + "); "
+    "END",
+]
+USER_CHANGES_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS change_log_user_insert AFTER INSERT ON user BEGIN "
+    + _LOG + "VALUES ('user', new.id, new.id, 'create', " + _NOW + "); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS change_log_user_update "
+    "AFTER UPDATE OF username, email, is_approved, is_admin, deleted_at ON user BEGIN "
+    + _LOG + "SELECT 'user', new.id, new.id, "
+    "CASE WHEN new.deleted_at IS NULL THEN 'update' ELSE 'delete' END, " + _NOW + " "
+    "WHERE old.deleted_at IS NULL; "
+    "END",
+    # Soft-deleted users were logged as deleted when they were marked
+    "CREATE TRIGGER IF NOT EXISTS change_log_user_delete AFTER DELETE ON user BEGIN "
+    + _LOG + "SELECT 'user', old.id, old.id, 'delete', " + _NOW + " WHERE old.deleted_at IS NULL; "
+    "END",
+]
+CHANGES_DDL = EVENT_CHANGES_DDL + USER_CHANGES_DDL
+
+# An entry is superseded once a later one exists for the same row and owner:
+# clients read the current row either way, so only the latest op matters
+COLLAPSE_SQL = (
+    "DELETE FROM change_log WHERE seq > :low AND seq <= :high AND EXISTS ("
+    "SELECT 1 FROM change_log AS later "
+    "WHERE later.entity = change_log.entity AND later.entity_id = change_log.entity_id "
+    "AND later.user_id = change_log.user_id AND later.seq > change_log.seq)"
+)
+
+for statement in EVENT_CHANGES_DDL:
+    event.listen(Event.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in USER_CHANGES_DDL:
+    event.listen(User.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def feed_bounds():
+    """Return (compacted_through, latest): the oldest `since` still served and the newest seq."""
+    compacted_through, latest = db.session.execute(text(
+        "SELECT (SELECT compacted_through FROM change_log_state WHERE id = 1), "
+        "(SELECT seq FROM sqlite_sequence WHERE name = 'change_log')"
+    )).one()
+    return compacted_through or 0, latest or 0
+
+
+def _expire(retention, batch_size, pause):
+    cutoff = (datetime.now(timezone.utc) - retention).strftime("%Y-%m-%d %H:%M:%S")
+    # Walks back from the newest entry, so it reads only what is kept
+    through = db.session.execute(
+        text("SELECT seq FROM change_log WHERE changed_at < :cutoff ORDER BY seq DESC LIMIT 1"),
+        {"cutoff": cutoff},
+    ).scalar()
+    if through is None:
+        return 0
+
+    # Move the horizon first: from here on older cursors get a 410 instead
+    # of quietly skipping entries that are about to disappear
+    db.session.execute(text(
+        "INSERT INTO change_log_state (id, compacted_through) VALUES (1, :through) "
+        "ON CONFLICT(id) DO UPDATE SET compacted_through = max(compacted_through, excluded.compacted_through)"
+    ), {"through": through})
+    db.session.commit()
+
+    expired = 0
+    while True:
+        result = db.session.execute(text(
+            "DELETE FROM change_log WHERE seq IN "
+            "(SELECT seq FROM change_log WHERE seq <= :through ORDER BY seq LIMIT :batch_size)"
+        ), {"through": through, "batch_size": batch_size})
+        db.session.commit()
+        expired += result.rowcount
+        if result.rowcount < batch_size:
+            return expired
+        if pause:
+            time.sleep(pause)
+
+
+def _collapse(batch_size, pause):
+    upto = db.session.execute(text("SELECT max(seq) FROM change_log")).scalar() or 0
+    collapsed = 0
+    low = 0
+    while low < upto:
+        high = db.session.execute(text(
+            "SELECT max(seq) FROM (SELECT seq FROM change_log "
+            "WHERE seq > :low AND seq <= :upto ORDER BY seq LIMIT :batch_size)"
+        ), {"low": low, "upto": upto, "batch_size": batch_size}).scalar()
+        if high is None:
+            break
+        result = db.session.execute(text(COLLAPSE_SQL), {"low": low, "high": high})
+        db.session.commit()
+        collapsed += result.rowcount
+        low = high
+        if pause:
+            time.sleep(pause)
+    return collapsed
+
+
+def compact_changes(retention, batch_size=500, pause=0.0):
+    """Keep the change log bounded by churn rather than by history.
+
+    Entries older than `retention` (a timedelta) are dropped, and
+    `compacted_through` moves past them so clients still syncing from there
+    are told to start over. Entries superseded by a later one for the same
+    row are dropped too; that never costs a client anything, so it doesn't
+    move the horizon. Both run `batch_size` rows per transaction, like the
+    blocklist purge. Returns (expired, collapsed).
+    """
+    started = time.perf_counter()
+    expired = _expire(retention, batch_size, pause)
+    collapsed = _collapse(batch_size, pause)
+
+    compaction_stats["runs"] += 1
+    compaction_stats["rows_expired"] += expired
+    compaction_stats["rows_collapsed"] += collapsed
+    compaction_stats["seconds"] += time.perf_counter() - started
+    return expired, collapsed
+
+
+def start_background_compactor(app):
+    """Compact the change log every CHANGE_LOG_COMPACT_INTERVAL seconds on a daemon thread."""
+    interval = app.config.get("CHANGE_LOG_COMPACT_INTERVAL", 0)
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    compact_changes(
+                        timedelta(days=app.config.get("CHANGE_LOG_RETENTION_DAYS", 30)),
+                        batch_size=app.config.get("CHANGE_LOG_COMPACT_BATCH_SIZE", 500),
+                    )
+                except Exception:
+                    app.logger.exception("Change log compaction failed")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name="change-log-compactor", daemon=True)
+    thread.start()
+    return thread
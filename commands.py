@@ -0,0 +1,208 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.security import generate_password_hash
+
+from blocklist import blocklist_size, purge_expired_tokens
+from changelog import compact_changes
+from deletion import deletion_stats, purge_deleted_users
+from event_stats import rebuild_event_stats
+from models import db, User
+from search import rebuild_search_index
+from streaming import chunked, iter_ndjson
+
+# flask blocklist ...
+blocklist_cli = AppGroup("blocklist", help="Maintain the revoked token blocklist.")
+
+
+@blocklist_cli.command("purge")
+@click.option("--batch-size", default=500, show_default=True, help="Rows deleted per transaction.")
+@click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between batches.")
+def purge_blocklist(batch_size, pause):
+    """Delete blocklist rows whose tokens have expired."""
+    started = time.perf_counter()
+    deleted = purge_expired_tokens(batch_size=batch_size, pause=pause)
+    elapsed = time.perf_counter() - started
+
+    rate = deleted / elapsed if elapsed else 0.0
+    click.echo(f"Deleted {deleted} expired rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+
+@blocklist_cli.command("stats")
+def blocklist_stats():
+    """Show the blocklist table size."""
+    total, expired = blocklist_size()
+    click.echo(f"rows: {total}")
+    click.echo(f"expired: {expired}")
+
+
+# flask users ...
+users_cli = AppGroup("users", help="Manage user accounts.")
+
+
+def _existing(column, values):
+    """Return which of `values` are already taken in `column`, in one query."""
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
+
+
+def _insert_users(rows):
+    """Insert a batch of users in one transaction, falling back to row by row."""
+    try:
+        db.session.execute(insert(User), rows)
+        db.session.commit()
+        return [None] * len(rows)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    errors = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(User), row)
+            errors.append(None)
+        except SQLAlchemyError:
+            errors.append("Username or email already exists")
+    db.session.commit()
+    return errors
+
+
+@users_cli.command("import")
+@click.argument("source", type=click.File("r"), default="-")
+@click.option("--batch-size", default=500, show_default=True, help="Users checked and inserted per transaction.")
+@click.option("--workers", default=None, type=int, help="Password hashing processes (defaults to one per CPU).")
+def import_users(source, batch_size, workers):
+    """Import users from an NDJSON file of {"username", "email", "password"} objects."""
+    started = time.perf_counter()
+    imported = skipped = 0
+
+    def skip(line, reason):
+        nonlocal skipped
+        skipped += 1
+        click.echo(f"line {line}: {reason}", err=True)
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunked(enumerate(iter_ndjson(source), start=1), batch_size):
+            candidates = []
+            seen_usernames, seen_emails = set(), set()
+
+            for line, (data, error) in chunk:
+                if error:
+                    skip(line, error)
+                    continue
+                if not isinstance(data, dict):
+                    skip(line, "Invalid user")
+                    continue
+
+                username = data.get('username')
+                email = data.get('email')
+                password = data.get('password')
+
+                # Same rules as POST /user
+                if not username or not email or not password:
+                    skip(line, "Missing fields")
+                elif username in seen_usernames:
+                    skip(line, "Username already exists")
+                elif email in seen_emails:
+                    skip(line, "Email already exists")
+                else:
+                    seen_usernames.add(username)
+                    seen_emails.add(email)
+                    candidates.append((line, username, email, password))
+
+            # One query per column for the whole batch instead of two per user
+            taken_usernames = _existing(User.username, seen_usernames)
+            taken_emails = _existing(User.email, seen_emails)
+
+            accepted = []
+            for line, username, email, password in candidates:
+                if username in taken_usernames:
+                    skip(line, "Username already exists")
+                elif email in taken_emails:
+                    skip(line, "Email already exists")
+                else:
+                    accepted.append((line, username, email, password))
+
+            hashes = pool.map(
+                partial(generate_password_hash, method=current_app.config["PASSWORD_HASH_METHOD"]),
+                [password for _, _, _, password in accepted],
+                chunksize=max(1, len(accepted) // (4 * workers)),
+            )
+            rows = [
+                {"username": username, "email": email, "password": hashed}
+                for (_, username, email, _), hashed in zip(accepted, hashes)
+            ]
+
+            for (line, _, _, _), error in zip(accepted, _insert_users(rows) if rows else []):
+                if error:
+                    skip(line, error)
+                else:
+                    imported += 1
+
+            elapsed = time.perf_counter() - started
+            click.echo(f"{imported} imported, {skipped} skipped ({imported / elapsed:.0f} users/s)")
+
+    elapsed = time.perf_counter() - started
+    rate = imported / elapsed if elapsed else 0.0
+    click.echo(f"Imported {imported} users, skipped {skipped} in {elapsed:.2f}s ({rate:.0f} users/s)")
+
+
+@users_cli.command("purge-deleted")
+@click.option("--batch-size", default=500, show_default=True, help="Events deleted per transaction.")
+@click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between batches.")
+def purge_deleted(batch_size, pause):
+    """Finish deleting users that were marked for background deletion."""
+    started = time.perf_counter()
+    events_before = deletion_stats["events_deleted"]
+    purged = purge_deleted_users(db.session, batch_size=batch_size, pause=pause)
+    elapsed = time.perf_counter() - started
+
+    events = deletion_stats["events_deleted"] - events_before
+    click.echo(f"Purged {purged} users and {events} events in {elapsed:.2f}s")
+
+
+# flask events ...
+events_cli = AppGroup("events", help="Maintain event data.")
+
+
+@events_cli.command("reindex")
+def reindex_events():
+    """Rebuild the full-text search index from the event table."""
+    started = time.perf_counter()
+    rebuild_search_index()
+    click.echo(f"Rebuilt the event search index in {time.perf_counter() - started:.2f}s")
+
+
+@events_cli.command("rebuild-stats")
+def rebuild_stats():
+    """Recompute the per-user event counters from the event table."""
+    started = time.perf_counter()
+    rebuild_event_stats()
+    click.echo(f"Rebuilt the per-user event stats in {time.perf_counter() - started:.2f}s")
+
+
+# flask changes ...
+changes_cli = AppGroup("changes", help="Maintain the change feed.")
+
+
+@changes_cli.command("compact")
+@click.option("--retention-days", default=None, type=float, help="Defaults to CHANGE_LOG_RETENTION_DAYS.")
+@click.option("--batch-size", default=500, show_default=True, help="Rows deleted per transaction.")
+@click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between batches.")
+def compact_change_log(retention_days, batch_size, pause):
+    """Drop expired and superseded change feed entries."""
+    if retention_days is None:
+        retention_days = current_app.config.get("CHANGE_LOG_RETENTION_DAYS", 30)
+    started = time.perf_counter()
+    expired, collapsed = compact_changes(timedelta(days=retention_days), batch_size=batch_size, pause=pause)
+    click.echo(f"Dropped {expired} expired and {collapsed} superseded entries in {time.perf_counter() - started:.2f}s")
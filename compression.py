@@ -0,0 +1,172 @@
+import gzip
+import threading
+import time
+import zlib
+
+from flask import current_app, request
+
+from cache import MemoryBackend
+
+# Appended to the ETag of a gzipped response: the compressed bytes are a
+# different representation, so they can't share a strong validator with
+# the uncompressed ones
+GZIP_ETAG_SUFFIX = "-gzip"
+
+# endpoint -> running totals, for the /metrics endpoint
+compression_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(endpoint, bytes_in, bytes_out, cpu_seconds, cache_hit=False):
+    with _stats_lock:
+        stats = compression_stats.get(endpoint)
+        if stats is None:
+            stats = compression_stats[endpoint] = {
+                "responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0, "cache_hits": 0
+            }
+        stats["responses"] += 1
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        stats["cpu_seconds"] += cpu_seconds
+        stats["cache_hits"] += cache_hit
+
+
+def compression_totals():
+    """A copy of compression_stats, safe to read while requests update it."""
+    with _stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in compression_stats.items()}
+
+
+def _iter_bytes(iterable):
+    for chunk in iterable:
+        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+class ResponseCompressor:
+    """Gzips JSON responses for clients that accept it.
+
+    Bodies under COMPRESS_MIN_SIZE bytes are sent as they are: the headers
+    and CPU would cost more than the bytes saved. Streamed responses are
+    compressed piece by piece, flushing after each one, so the client gets
+    every piece as soon as it would have uncompressed. The compressed body
+    of a response with a strong ETag is kept, keyed by that ETag, and
+    `cached_response` answers later requests for it without building the
+    body again.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.level = 3
+        self.mimetypes = frozenset()
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+        app.config.setdefault("COMPRESS_LEVEL", 3)
+        app.config.setdefault("COMPRESS_MIMETYPES", ("application/json", "application/x-ndjson"))
+        app.config.setdefault("COMPRESS_CACHE_SIZE", 1000)
+        app.config.setdefault("COMPRESS_CACHE_TTL", 300)
+
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.level = app.config["COMPRESS_LEVEL"]
+        self.mimetypes = frozenset(app.config["COMPRESS_MIMETYPES"])
+        self.cache = MemoryBackend(app.config["COMPRESS_CACHE_SIZE"], app.config["COMPRESS_CACHE_TTL"])
+        app.after_request(self.compress)
+        app.extensions["response_compressor"] = self
+
+    @staticmethod
+    def accepts_gzip():
+        return request.accept_encodings["gzip"] > 0
+
+    def cached_response(self, etag):
+        """The cached gzipped response for `etag`, or None if the client can't take it or there isn't one."""
+        if self.cache is None or not self.accepts_gzip():
+            return None
+        entry = self.cache.get(etag)
+        if entry is None:
+            return None
+
+        status, mimetype, body, raw_size = entry
+        response = current_app.response_class(body, status=status, mimetype=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        response.set_etag(etag + GZIP_ETAG_SUFFIX)
+        _record(request.endpoint, raw_size, len(body), 0.0, cache_hit=True)
+        return response
+
+    def compress(self, response):
+        if (
+            response.mimetype not in self.mimetypes
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+
+        if response.is_streamed:
+            response.vary.add("Accept-Encoding")
+            if self.accepts_gzip():
+                self._compress_stream(response)
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.vary.add("Accept-Encoding")
+        if not self.accepts_gzip():
+            return response
+
+        started = time.thread_time()
+        # mtime=0 keeps the output the same for the same body
+        body = gzip.compress(data, self.level, mtime=0)
+        _record(request.endpoint, len(data), len(body), time.thread_time() - started)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+            if not weak and response.status_code == 200:
+                self.cache.set(etag, (response.status_code, response.mimetype, body, len(data)))
+        return response
+
+    def _compress_stream(self, response):
+        chunks = response.response
+        endpoint = request.endpoint
+        level = self.level
+
+        def generate():
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+            bytes_in = bytes_out = 0
+            cpu_seconds = 0.0
+            try:
+                for chunk in _iter_bytes(chunks):
+                    if not chunk:
+                        continue
+                    started = time.thread_time()
+                    data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    cpu_seconds += time.thread_time() - started
+                    bytes_in += len(chunk)
+                    bytes_out += len(data)
+                    yield data
+                data = compressor.flush()
+                bytes_out += len(data)
+                yield data
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+                _record(endpoint, bytes_in, bytes_out, cpu_seconds)
+
+        response.response = generate()
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers.pop("Content-Length", None)
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + GZIP_ETAG_SUFFIX, weak)
+
+
+response_compressor = ResponseCompressor()
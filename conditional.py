@@ -0,0 +1,48 @@
+import hashlib
+
+from flask import current_app, make_response, request
+
+from compression import GZIP_ETAG_SUFFIX, response_compressor
+
+
+def etag_for(query_string, *parts):
+    """Hash row versions and the raw query string into an ETag value."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    digest.update(query_string)
+    return digest.hexdigest()
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the row versions behind a response.
+
+    The query string is mixed in because parameters such as `stream` change
+    the representation without changing the rows.
+    """
+    return etag_for(request.query_string, *parts)
+
+
+def conditional_response(etag, build):
+    """Answer 304 if the client already has `etag`, otherwise call `build()`.
+
+    `build` returns anything a view could return, and is only called when the
+    body is actually needed, so a matching If-None-Match never loads or
+    serializes the rows. Neither does a request for a body whose gzipped
+    copy is cached. Clients holding the gzipped representation send its
+    tag back, and get it back on the 304.
+    """
+    for tag in (etag, etag + GZIP_ETAG_SUFFIX):
+        if request.if_none_match.contains(tag):
+            response = current_app.response_class(status=304)
+            response.set_etag(tag)
+            # Same Vary as the 200, or caches would reuse one encoding for both
+            response.vary.add("Accept-Encoding")
+            return response
+
+    response = response_compressor.cached_response(etag)
+    if response is None:
+        response = make_response(build())
+        response.set_etag(etag)
+    return response
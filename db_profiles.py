@@ -0,0 +1,126 @@
+import os
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Named connection profiles. Pragmas are applied to every new SQLite
+# connection; engine options go straight to create_engine().
+PROFILES = {
+    # SQLite and SQLAlchemy defaults
+    "default": {
+        "pragmas": {},
+        "engine_options": {},
+    },
+    # Readers don't block the writer, and writers wait instead of failing
+    # straight away with "database is locked"
+    "sqlite-wal": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -64000,  # 64 MB
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+        },
+        "engine_options": {
+            "pool_size": 10,
+            "max_overflow": 10,
+            "pool_recycle": 3600,
+        },
+    },
+    # Throwaway databases (benchmarks, imports into scratch files) that can be
+    # rebuilt if the machine crashes halfway through
+    "sqlite-bulk": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "busy_timeout": 30000,
+            "cache_size": -256000,
+            "temp_store": "MEMORY",
+        },
+        "engine_options": {},
+    },
+}
+
+# Name of the SQLALCHEMY_BINDS entry that read-only views are routed to
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(Session):
+    """Session that sends everything to the replica inside read-only views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get("db_read_only"):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Route the database work of a view to the read-only engine, if one is configured.
+
+    The flag lives on `g` for the whole request, so streamed responses that
+    query after the view returns are routed as well.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def _default_replica_uri(app):
+    # Without a dedicated replica, read through a second pool on the same file;
+    # in WAL mode those readers never wait on the writer
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+
+    database = url.database
+    if not os.path.isabs(database):
+        database = os.path.join(app.instance_path, database)
+    return url.set(database=database).render_as_string(hide_password=False)
+
+
+def configure_database(app):
+    """Fill in engine options and the replica bind. Call before db.init_app()."""
+    profile = PROFILES[app.config.setdefault("DATABASE_PROFILE", "sqlite-wal")]
+
+    options = dict(profile["engine_options"])
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    replica_uri = app.config.get("DATABASE_REPLICA_URI") or _default_replica_uri(app)
+    if replica_uri:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = replica_uri
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s = %s" % (name, value))
+        cursor.close()
+
+    return set_pragmas
+
+
+def apply_connection_profile(app, db):
+    """Install the profile's per-connection pragmas. Call after db.init_app()."""
+    pragmas = PROFILES[app.config["DATABASE_PROFILE"]]["pragmas"]
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            engine_pragmas = dict(pragmas)
+            if key == REPLICA_BIND:
+                # Anything that tries to write through the replica is a bug
+                engine_pragmas["query_only"] = "ON"
+            if engine_pragmas:
+                event.listen(engine, "connect", _pragma_listener(engine_pragmas))
@@ -0,0 +1,148 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select, update
+
+from models import db, Event, User
+
+# Running totals for user deletions in this process
+deletion_stats = {"users_deleted": 0, "events_deleted": 0, "users_soft_deleted": 0, "seconds": 0.0}
+
+# Set when a user is soft-deleted, so the purger starts without waiting out its interval
+_purge_requested = threading.Event()
+
+# Criterion for event reads: a soft-deleted user's events stay in the table
+# until they are purged, but are hidden like the user. The subquery runs
+# once per statement, over the deleted_at index
+OWNER_NOT_DELETED = Event.user_id.not_in(select(User.id).where(User.deleted_at.is_not(None)))
+
+
+def purge_user(session, user_id, batch_size=500, pause=0.0):
+    """Delete a user and their events with set-based statements.
+
+    Events go `batch_size` at a time with a commit after every full batch, so
+    the SQLite write lock is never held for long and other writers can get
+    in between. The last, partial batch and the user row are deleted in one
+    transaction: once it has written it holds the lock, so no new event can
+    slip in between them. Nothing is loaded into the session.
+
+    Revoked tokens stay in the blocklist: they are not tied to a user and
+    have to keep failing until they expire and the blocklist purge removes
+    them. Returns the number of events deleted, or None if there was no
+    such user.
+    """
+    started = time.perf_counter()
+    events = 0
+    while True:
+        event_ids = select(Event.id).where(Event.user_id == user_id).limit(batch_size).scalar_subquery()
+        result = session.execute(
+            delete(Event).where(Event.id.in_(event_ids)).execution_options(synchronize_session=False)
+        )
+        events += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        session.commit()
+        if pause:
+            time.sleep(pause)
+
+    result = session.execute(
+        delete(User).where(User.id == user_id).execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+    deletion_stats["events_deleted"] += events
+    deletion_stats["seconds"] += time.perf_counter() - started
+    if not result.rowcount:
+        return None
+    deletion_stats["users_deleted"] += 1
+    return events
+
+
+def live_event_count(session, user_id, limit):
+    """Count a user's events, no further than `limit`.
+
+    Returns None if there is no such user, or they are already marked
+    deleted: to every route they are gone, and the purge owns their rows.
+    """
+    owned = select(Event.id).where(Event.user_id == user_id).limit(limit).subquery()
+    count = select(func.count()).select_from(owned).scalar_subquery()
+    return session.scalar(select(count).where(User.id == user_id, User.deleted_at.is_(None)))
+
+
+def soft_delete_user(session, user_id):
+    """Mark a user as deleted and leave removing the rows to `purge_deleted_users`.
+
+    Takes one UPDATE however many events the user has. The version is bumped
+    like any other change, so cached copies and ETags go stale. Returns
+    False if there was no such user, or they were already marked.
+    """
+    result = session.execute(
+        update(User)
+        .where(User.id == user_id, User.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(timezone.utc), version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    if not result.rowcount:
+        return False
+    deletion_stats["users_soft_deleted"] += 1
+    _purge_requested.set()
+    return True
+
+
+def delete_or_schedule(session, user_id, batch_size=500, pause=0.0, async_threshold=None, force_async=False):
+    """Delete a user now, or soft-delete them if they own more than `async_threshold` events.
+
+    Returns "deleted", "scheduled", or None if there is no such user (or they
+    were already soft-deleted).
+    """
+    events = live_event_count(session, user_id, (async_threshold or 0) + 1)
+    if events is None:
+        return None
+    if force_async or (async_threshold is not None and events > async_threshold):
+        return "scheduled" if soft_delete_user(session, user_id) else None
+    return "deleted" if purge_user(session, user_id, batch_size, pause) is not None else None
+
+
+def purge_deleted_users(session, batch_size=500, pause=0.0):
+    """Finish deleting every soft-deleted user, oldest first. Returns how many were purged."""
+    user_ids = session.scalars(
+        select(User.id).where(User.deleted_at.is_not(None)).order_by(User.deleted_at)
+    ).all()
+    purged = 0
+    for user_id in user_ids:
+        if purge_user(session, user_id, batch_size, pause) is not None:
+            purged += 1
+    return purged
+
+
+def start_background_user_purger(app):
+    """Purge soft-deleted users on a daemon thread.
+
+    Runs as soon as a user is soft-deleted in this process, and every
+    USER_PURGE_INTERVAL seconds to pick up ones marked by other workers.
+    """
+    interval = app.config.get("USER_PURGE_INTERVAL", 0)
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            _purge_requested.wait(interval)
+            _purge_requested.clear()
+            with app.app_context():
+                try:
+                    purge_deleted_users(
+                        db.session,
+                        batch_size=app.config.get("USER_DELETE_BATCH_SIZE", 500),
+                        pause=app.config.get("USER_DELETE_PAUSE", 0.0),
+                    )
+                except Exception:
+                    app.logger.exception("User purge failed")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name="user-purger", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, event, func, select, text
+
+from models import db, Event, User, UserEventStats
+
+# Whether an event counts as upcoming: dated on or after the stats date. No
+# date yet means every event is upcoming until the first roll.
+_UPCOMING = "(%s.event_date >= coalesce((SELECT as_of FROM user_event_stats_date WHERE id = 1), ''))"
+
+_ADD = (
+    "INSERT INTO user_event_stats (user_id, event_count, upcoming_count) "
+    "VALUES (new.user_id, 1, " + _UPCOMING % "new" + ") "
+    "ON CONFLICT(user_id) DO UPDATE SET event_count = event_count + 1, "
+    "upcoming_count = upcoming_count + excluded.upcoming_count; "
+)
+_REMOVE = (
+    "UPDATE user_event_stats SET event_count = event_count - 1, "
+    "upcoming_count = upcoming_count - " + _UPCOMING % "old" + " WHERE user_id = old.user_id; "
+    "DELETE FROM user_event_stats WHERE user_id = old.user_id AND event_count = 0; "
+)
+
+# Triggers keep user_event_stats in step with every write to event, in the
+# writer's own transaction: the views, bulk inserts and set-based deletes alike
+STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS user_event_stats_insert AFTER INSERT ON event BEGIN " + _ADD + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_event_stats_delete AFTER DELETE ON event BEGIN " + _REMOVE + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_event_stats_update AFTER UPDATE OF user_id, event_date ON event "
+    "BEGIN " + _REMOVE + _ADD + "END",
+]
+
+# Events dated between the stats date and :today have become past since the
+# last roll. The old date is read inside the statement, so a roll that
+# another worker already made leaves an empty range here.
+ROLL_SQL = (
+    "UPDATE user_event_stats SET upcoming_count = upcoming_count - rolled.past "
+    "FROM ("
+    "SELECT user_id, count(*) AS past FROM event "
+    "WHERE event_date >= coalesce((SELECT as_of FROM user_event_stats_date WHERE id = 1), '') "
+    "AND event_date < :today GROUP BY user_id"
+    ") AS rolled "
+    "WHERE user_event_stats.user_id = rolled.user_id"
+)
+ADVANCE_DATE_SQL = (
+    "INSERT INTO user_event_stats_date (id, as_of) VALUES (1, :today) "
+    "ON CONFLICT(id) DO UPDATE SET as_of = excluded.as_of WHERE excluded.as_of > as_of"
+)
+
+REBUILD_SQL = [
+    "DELETE FROM user_event_stats",
+    "INSERT INTO user_event_stats (user_id, event_count, upcoming_count) "
+    "SELECT user_id, count(*), sum(event_date >= :today) FROM event GROUP BY user_id",
+    "INSERT INTO user_event_stats_date (id, as_of) VALUES (1, :today) "
+    "ON CONFLICT(id) DO UPDATE SET as_of = excluded.as_of",
+]
+
+# Created alongside the event table by db.create_all(), like the search index
+for statement in STATS_DDL:
+    event.listen(Event.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def stats_today():
+    """The date upcoming and past are split on: today, in UTC."""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def roll_event_stats(session):
+    """Bring upcoming_count forward to today, returning the date it counts from.
+
+    Costs one small read except on the first call of a day, which moves the
+    events dated since the last roll from upcoming to past with a scan of
+    just those days on the event_date index.
+    """
+    today = stats_today()
+    as_of = session.execute(text("SELECT as_of FROM user_event_stats_date WHERE id = 1")).scalar()
+    if as_of is not None and as_of >= today:
+        return as_of
+
+    # End the read transaction, so the writes below start from the latest
+    # stats date instead of failing on a stale snapshot
+    session.commit()
+    session.execute(text(ROLL_SQL), {"today": today})
+    session.execute(text(ADVANCE_DATE_SQL), {"today": today})
+    session.commit()
+    return today
+
+
+def event_stats_page(session, limit, after):
+    """One page of /users/stats: per-user counts after the `after` cursor, and totals.
+
+    Rolls the stats forward first, so it needs a session that can write.
+    """
+    as_of = roll_event_stats(session)
+
+    event_count = func.coalesce(UserEventStats.event_count, 0)
+    upcoming_count = func.coalesce(UserEventStats.upcoming_count, 0)
+    rows = session.execute(
+        select(User.id, event_count, upcoming_count)
+        .outerjoin(UserEventStats, UserEventStats.user_id == User.id)
+        .where(User.id > after, User.deleted_at.is_(None))
+        .order_by(User.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    total_events, total_upcoming = session.execute(
+        select(func.coalesce(func.sum(UserEventStats.event_count), 0),
+               func.coalesce(func.sum(UserEventStats.upcoming_count), 0))
+        .join(User, User.id == UserEventStats.user_id)
+        .where(User.deleted_at.is_(None))
+    ).one()
+
+    return {
+        "as_of": as_of,
+        "users": [
+            {"id": user_id, "event_count": events, "upcoming_count": upcoming, "past_count": events - upcoming}
+            for user_id, events, upcoming in rows
+        ],
+        "totals": {
+            "event_count": total_events,
+            "upcoming_count": total_upcoming,
+            "past_count": total_events - total_upcoming,
+        },
+        "next_cursor": rows[-1][0] if has_more else None
+    }
+
+
+def rebuild_event_stats():
+    """Recompute user_event_stats from the event table in one transaction."""
+    with db.engine.begin() as conn:
+        for statement in STATS_DDL:
+            conn.execute(text(statement))
+        for statement in REBUILD_SQL:
+            conn.execute(text(statement), {"today": stats_today()})
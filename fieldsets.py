@@ -0,0 +1,52 @@
+from datetime import date
+
+from flask import request
+from sqlalchemy.orm import load_only
+
+
+def get_fields(available):
+    """Read `?fields=a,b` from the query string, returning (fields, error).
+
+    `available` is everything the endpoint normally returns, and is what
+    comes back without the parameter; clients can narrow it but never widen
+    it. Unknown names are an error.
+    """
+    return parse_fields(request.args.get("fields", ""), available)
+
+
+def parse_fields(value, available):
+    """Check a comma-separated field list against `available`, returning (fields, error)."""
+    if not value.strip():
+        return available, None
+
+    fields = []
+    for name in value.split(","):
+        name = name.strip()
+        if name and name not in fields:
+            fields.append(name)
+
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        return None, "Unknown field(s): %s" % ", ".join(unknown)
+    return tuple(fields), None
+
+
+def load_fields(model, fields, *always):
+    """A `load_only` option selecting just `fields`, plus columns the query needs anyway."""
+    names = [name for name in fields if hasattr(model.__table__.c, name)]
+    names += [name for name in always if name not in names]
+    return load_only(*(getattr(model, name) for name in names))
+
+
+def to_dict(obj, fields):
+    """Copy `fields` off a row into a JSON-ready dict."""
+    data = {}
+    for name in fields:
+        value = getattr(obj, name)
+        data[name] = value.isoformat() if isinstance(value, date) else value
+    return data
+
+
+def project(data, fields):
+    """Narrow an already serialized dict to `fields`."""
+    return {name: data[name] for name in fields}
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, has_request_context, jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+# Running totals for the /metrics endpoint
+hash_stats = {"operations": 0, "seconds": 0.0, "rejected": 0}
+_stats_lock = threading.Lock()
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full and the request should back off."""
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded worker pool.
+
+    hashlib's scrypt and pbkdf2 release the GIL, so a small thread pool runs
+    them in parallel while request threads wait. At most `workers + queue`
+    operations are accepted at once; past that callers get HasherBusy (a 503)
+    instead of piling up behind a burst of logins.
+    """
+
+    def __init__(self, app=None):
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 4)
+        app.config.setdefault("PASSWORD_HASH_QUEUE", 32)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+
+        self.configure(
+            app.config["PASSWORD_HASH_METHOD"],
+            app.config["PASSWORD_HASH_WORKERS"],
+            app.config["PASSWORD_HASH_QUEUE"],
+            app.config["PASSWORD_HASH_TIMEOUT"],
+        )
+
+        app.register_error_handler(HasherBusy, self._busy)
+        app.before_request(self._start_timer)
+        app.after_request(self._add_server_timing)
+        app.extensions["password_hasher"] = self
+
+    def configure(self, method=DEFAULT_METHOD, workers=4, queue=32, timeout=10):
+        """Create the worker pool; init_app calls this with the app's config."""
+        self.method = method
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def _busy(self, error):
+        response = jsonify({"message": "Server busy, please retry"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+
+    def _start_timer(self):
+        g.request_started = time.perf_counter()
+        g.hash_seconds = 0.0
+
+    def _add_server_timing(self, response):
+        # Lets clients and load tests separate hashing time from the rest of the request
+        started = g.get("request_started")
+        if started is not None and g.hash_seconds:
+            total = time.perf_counter() - started
+            response.headers.add(
+                "Server-Timing",
+                "hash;dur=%.1f, app;dur=%.1f" % (g.hash_seconds * 1000, (total - g.hash_seconds) * 1000),
+            )
+        return response
+
+    def _submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            with _stats_lock:
+                hash_stats["rejected"] += 1
+            raise HasherBusy()
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        # Keep the slot until the work is really done, even if we stop waiting
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    @staticmethod
+    def _record(started):
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            hash_stats["operations"] += 1
+            hash_stats["seconds"] += elapsed
+        return elapsed
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        result = self._submit(fn, *args).result(timeout=self.timeout)
+
+        elapsed = self._record(started)
+        if has_request_context():
+            g.hash_seconds = g.get("hash_seconds", 0.0) + elapsed
+        return result
+
+    async def _run_async(self, fn, *args):
+        # The event loop keeps serving other requests while the pool works
+        started = time.perf_counter()
+        result = await asyncio.wait_for(asyncio.wrap_future(self._submit(fn, *args)), self.timeout)
+        self._record(started)
+        return result
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    async def hash_async(self, password):
+        return await self._run_async(generate_password_hash, password, self.method)
+
+    async def verify_async(self, pwhash, password):
+        return await self._run_async(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if `pwhash` was made with a different method or cost than configured."""
+        return pwhash.split("$", 1)[0] != self.method
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import has_request_context, request
+from flask.logging import default_handler
+
+# Running totals for the /metrics endpoint
+log_stats = {"dropped": 0, "sampled_out": 0}
+_stats_lock = threading.Lock()
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+def _count(key):
+    with _stats_lock:
+        log_stats[key] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, then any extras."""
+
+    def format(self, record):
+        entry = {
+            "ts": "%s.%03dZ" % (time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)), record.msecs),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestSampler(logging.Filter):
+    """Tags records with the current request and samples the chatty ones.
+
+    Runs on the request thread, so it only reads a few attributes and rolls
+    a random number. Warnings and errors are always kept; below that, each
+    endpoint keeps the fraction of records given in `rates`.
+    """
+
+    def __init__(self, rates, default_rate=1.0):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+
+        endpoint = request.endpoint
+        record.endpoint = endpoint
+        record.method = request.method
+        record.path = request.path
+
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(endpoint, self.default_rate)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        _count("sampled_out")
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def prepare(self, record):
+        # Merge the arguments now, while they still hold the values being
+        # logged; the JSON encoding and the write happen on the listener
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+
+class StructuredLogging:
+    """Routes all logging through a bounded queue drained by one background thread.
+
+    Request threads only filter and enqueue records; formatting to JSON and
+    writing to the stream happen on the listener thread, so a slow stdout
+    can't hold up a login. Level checks stay the standard library's cached
+    `isEnabledFor`, and messages use %-style arguments, so disabled levels
+    cost next to nothing.
+    """
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("LOG_LEVEL", "INFO")
+        app.config.setdefault("LOG_QUEUE_SIZE", 10000)
+        app.config.setdefault("LOG_SAMPLE_RATES", {})
+        app.config.setdefault("LOG_DEFAULT_SAMPLE_RATE", 1.0)
+        app.extensions["structured_logging"] = self
+
+        if self.listener is not None:
+            return
+
+        log_queue = queue.Queue(app.config["LOG_QUEUE_SIZE"])
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        self.handler = NonBlockingQueueHandler(log_queue)
+        self.handler.addFilter(RequestSampler(
+            app.config["LOG_SAMPLE_RATES"], app.config["LOG_DEFAULT_SAMPLE_RATE"]
+        ))
+        self.listener = QueueListener(log_queue, output)
+        self.listener.start()
+        # Flush whatever is still queued when the process exits
+        atexit.register(self.listener.stop)
+
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        root.setLevel(app.config["LOG_LEVEL"])
+
+        # Flask's own stderr handler would write synchronously alongside ours
+        app.logger.removeHandler(default_handler)
+
+    def queued(self):
+        return self.handler.queue.qsize() if self.handler is not None else 0
+
+
+structured_logging = StructuredLogging()
@@ -0,0 +1,46 @@
+from flask import request
+
+# Most ids a single multi-get may ask for
+MAX_LOOKUP_IDS = 1000
+# Ids per IN (...) query, well under SQLite's limit on bound parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+def get_ids():
+    """Read the ids to fetch, returning (ids, error).
+
+    GET requests pass them as `?ids=3,1,2`; POST requests send
+    `{"ids": [3, 1, 2]}` so long lists don't run into URL length limits.
+    Order is kept and repeats are dropped.
+    """
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        values = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(values, list):
+            return None, "Expected a JSON object with an ids list"
+    else:
+        values = [value for value in request.args.get("ids", "").split(",") if value.strip()]
+    return parse_ids(values)
+
+
+def parse_ids(values):
+    """Check a list of ids given as strings or numbers, returning (ids, error)."""
+    ids = []
+    seen = set()
+    for value in values:
+        try:
+            # int() would quietly accept true and 1.5
+            if isinstance(value, (bool, float)):
+                raise ValueError
+            id = int(value)
+        except (TypeError, ValueError):
+            return None, "Invalid id: %s" % value
+        if id not in seen:
+            seen.add(id)
+            ids.append(id)
+
+    if not ids:
+        return None, "No ids given"
+    if len(ids) > MAX_LOOKUP_IDS:
+        return None, "Too many ids, at most %d per request" % MAX_LOOKUP_IDS
+    return ids, None
@@ -0,0 +1,257 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+
+from blocklist import blocklist_size, purge_stats, revocation_cache
+from broker import event_broker
+from cache import entity_cache
+from changelog import compaction_stats
+from compression import compression_totals
+from deletion import deletion_stats
+from hashing import hash_stats
+from logs import log_stats, structured_logging
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values, Prometheus style."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # One slot per bucket plus +Inf, then the running sum
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self.series.items())
+        for label_values, series in items:
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, labels, bound, cumulative))
+            lines.append("%s_sum{%s} %r" % (self.name, labels, series[-1]))
+            lines.append("%s_count{%s} %d" % (self.name, labels, cumulative))
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self._lock:
+            items = sorted(self.series.items())
+        for label_values, value in items:
+            lines.append("%s{%s} %r" % (self.name, _labels(self.labels, label_values), value))
+        return lines
+
+
+def _labels(names, values):
+    return ",".join('%s="%s"' % (name, str(value).replace('"', '\\"')) for name, value in zip(names, values))
+
+
+def _gauge(name, help, value, kind="gauge"):
+    return ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, kind), "%s %r" % (name, value)]
+
+
+requests_total = Counter(
+    "http_requests_total", "Requests handled, by endpoint and status.", ("endpoint", "method", "status")
+)
+request_duration = Histogram(
+    "http_request_duration_seconds", "Wall time per request, including streamed bodies.",
+    ("endpoint",), LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    "http_request_sql_statements", "SQL statements executed per request.",
+    ("endpoint",), QUERY_COUNT_BUCKETS,
+)
+request_sql_duration = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request.",
+    ("endpoint",), LATENCY_BUCKETS,
+)
+
+# Extra sources of metric lines, called on every scrape
+collectors = []
+
+
+def collect_caches():
+    stats = entity_cache.stats()
+    lines = _gauge("entity_cache_entries", "Rows held in the entity cache.", stats["entries"])
+    lines += _gauge("entity_cache_hits_total", "Entity cache hits.", stats["hits"], "counter")
+    lines += _gauge("entity_cache_misses_total", "Entity cache misses.", stats["misses"], "counter")
+    lines += _gauge("entity_cache_evictions_total", "Entity cache LRU evictions.", stats["evictions"], "counter")
+
+    stats = revocation_cache.stats()
+    lines += _gauge("revocation_cache_hits_total", "Revocation checks answered without SQL.", stats["hits"], "counter")
+    lines += _gauge("revocation_cache_queries_total", "SQL queries made by the revocation cache.", stats["queries"], "counter")
+    return lines
+
+
+def collect_blocklist():
+    total, expired = blocklist_size()
+    stats = revocation_cache.stats()
+    fill = round(stats["bloom_entries"] / stats["bloom_capacity"], 4) if stats["bloom_capacity"] else 0.0
+    lines = _gauge("blocklist_rows", "Rows in the token blocklist table.", total)
+    lines += _gauge("blocklist_expired_rows", "Blocklist rows whose token has expired but not been purged yet.", expired)
+    lines += _gauge("revocation_filter_entries", "Revoked tokens held in this process's bloom filter.", stats["bloom_entries"])
+    lines += _gauge("revocation_filter_fill_ratio", "Bloom filter entries over the capacity it was sized for.", fill)
+    return lines
+
+
+def collect_workers():
+    lines = _gauge("password_hash_operations_total", "Password hashes and checks.", hash_stats["operations"], "counter")
+    lines += _gauge("password_hash_seconds_total", "Time spent hashing passwords.", hash_stats["seconds"], "counter")
+    lines += _gauge("password_hash_rejected_total", "Hash requests refused because the queue was full.", hash_stats["rejected"], "counter")
+    lines += _gauge("blocklist_purge_rows_total", "Expired blocklist rows purged by this process.", purge_stats["rows_deleted"], "counter")
+    lines += _gauge("blocklist_purge_seconds_total", "Time spent purging the blocklist.", purge_stats["seconds"], "counter")
+    lines += _gauge("user_deletes_total", "Users deleted by this process.", deletion_stats["users_deleted"], "counter")
+    lines += _gauge("user_soft_deletes_total", "Users marked for background deletion.", deletion_stats["users_soft_deleted"], "counter")
+    lines += _gauge("user_delete_events_total", "Events deleted along with their users.", deletion_stats["events_deleted"], "counter")
+    lines += _gauge("user_delete_seconds_total", "Time spent deleting users and their events.", deletion_stats["seconds"], "counter")
+    lines += _gauge("change_log_expired_total", "Change feed entries dropped by retention.", compaction_stats["rows_expired"], "counter")
+    lines += _gauge("change_log_collapsed_total", "Superseded change feed entries dropped.", compaction_stats["rows_collapsed"], "counter")
+    stats = event_broker.stats()
+    lines += _gauge("event_stream_subscribers", "Clients connected to /events/stream.", stats["subscribers"])
+    lines += _gauge("event_stream_published_total", "Event changes published to the stream broker.", stats["published"], "counter")
+    lines += _gauge("event_stream_delivered_total", "Event changes queued for stream clients.", stats["delivered"], "counter")
+    lines += _gauge("event_stream_overflows_total", "Stream clients disconnected for falling behind.", stats["overflows"], "counter")
+    return lines
+
+
+def collect_compression():
+    items = sorted((endpoint or "unmatched", stats) for endpoint, stats in compression_totals().items())
+
+    lines = []
+    for name, help, key, kind in (
+        ("http_compressed_responses_total", "Responses sent gzipped, by endpoint.", "responses", "counter"),
+        ("http_compression_cache_hits_total", "Gzipped responses served from the compressed copy cache.", "cache_hits", "counter"),
+        ("http_compression_input_bytes_total", "Response bytes before compression.", "bytes_in", "counter"),
+        ("http_compression_output_bytes_total", "Response bytes after compression.", "bytes_out", "counter"),
+        ("http_compression_cpu_seconds_total", "CPU time spent compressing responses.", "cpu_seconds", "counter"),
+        ("http_compression_ratio", "Compressed over uncompressed bytes so far.", None, "gauge"),
+    ):
+        lines += ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, kind)]
+        for endpoint, stats in items:
+            if key is None:
+                value = round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else 0.0
+            else:
+                value = stats[key]
+            lines.append("%s{%s} %r" % (name, _labels(("endpoint",), (endpoint,)), value))
+    return lines
+
+
+def collect_logging():
+    lines = _gauge("log_queue_records", "Log records waiting for the writer thread.", structured_logging.queued())
+    lines += _gauge("log_records_dropped_total", "Log records dropped because the queue was full.", log_stats["dropped"], "counter")
+    lines += _gauge("log_records_sampled_out_total", "Log records skipped by per-endpoint sampling.", log_stats["sampled_out"], "counter")
+    return lines
+
+
+collectors.extend([collect_caches, collect_blocklist, collect_workers, collect_compression, collect_logging])
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "sql_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    if has_app_context():
+        stats = g.get("request_stats")
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+
+def _handle_error(context):
+    # after_cursor_execute doesn't fire for failed statements
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.get("request_stats")
+    if stats is None:
+        return response
+
+    endpoint = request.endpoint or "unmatched"
+    method = request.method
+    status = response.status_code
+
+    # Recorded when the body has been sent, so streamed responses count in full
+    def record():
+        requests_total.inc((endpoint, method, status))
+        request_duration.observe((endpoint,), time.perf_counter() - stats.started)
+        request_queries.observe((endpoint,), stats.queries)
+        request_sql_duration.observe((endpoint,), stats.sql_seconds)
+
+    response.call_on_close(record)
+    return response
+
+
+def render_metrics():
+    lines = []
+    for metric in (requests_total, request_duration, request_queries, request_sql_duration):
+        lines.extend(metric.render())
+    for collector in collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app, db):
+    """Hook request timing and SQL counting into the app and every engine."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
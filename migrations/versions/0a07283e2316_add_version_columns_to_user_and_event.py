@@ -0,0 +1,34 @@
+"""Add row version columns to user and event
+
+Revision ID: 0a07283e2316
+Revises: a528d2915dfd
+Create Date: 2026-10-18 12:41:55.730286
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a07283e2316'
+down_revision = 'a528d2915dfd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.create_index('ix_event_user_id_version', ['user_id', 'version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_user_id_version')
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,28 @@
+"""Add deleted_at to user for background account deletion
+
+Revision ID: 5c5bf9c6cf74
+Revises: 0a07283e2316
+Create Date: 2026-10-18 13:52:08.417395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c5bf9c6cf74'
+down_revision = '0a07283e2316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_deleted_at'), ['deleted_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_deleted_at'))
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,50 @@
+"""Add FTS5 full-text index over event title and description
+
+Revision ID: a528d2915dfd
+Revises: d87bf97aee64
+Create Date: 2026-10-18 11:20:03.114872
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a528d2915dfd'
+down_revision = 'd87bf97aee64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE event_fts USING fts5("
+        "title, description, content='event', content_rowid='id')"
+    )
+    op.execute(
+        "CREATE TRIGGER event_fts_insert AFTER INSERT ON event BEGIN "
+        "INSERT INTO event_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER event_fts_delete AFTER DELETE ON event BEGIN "
+        "INSERT INTO event_fts(event_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER event_fts_update AFTER UPDATE OF title, description ON event BEGIN "
+        "INSERT INTO event_fts(event_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO event_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+        "END"
+    )
+
+    # Index the events that already exist
+    op.execute("INSERT INTO event_fts(event_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS event_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS event_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS event_fts_insert")
+    op.execute("DROP TABLE IF EXISTS event_fts")
@@ -0,0 +1,66 @@
+"""Add per-user event counters maintained by triggers
+
+Revision ID: a7029371a3ac
+Revises: 5c5bf9c6cf74
+Create Date: 2026-10-18 14:20:41.907113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7029371a3ac'
+down_revision = '5c5bf9c6cf74'
+branch_labels = None
+depends_on = None
+
+UPCOMING = "(%s.event_date >= coalesce((SELECT as_of FROM user_event_stats_date WHERE id = 1), ''))"
+ADD = (
+    "INSERT INTO user_event_stats (user_id, event_count, upcoming_count) "
+    "VALUES (new.user_id, 1, " + UPCOMING % "new" + ") "
+    "ON CONFLICT(user_id) DO UPDATE SET event_count = event_count + 1, "
+    "upcoming_count = upcoming_count + excluded.upcoming_count; "
+)
+REMOVE = (
+    "UPDATE user_event_stats SET event_count = event_count - 1, "
+    "upcoming_count = upcoming_count - " + UPCOMING % "old" + " WHERE user_id = old.user_id; "
+    "DELETE FROM user_event_stats WHERE user_id = old.user_id AND event_count = 0; "
+)
+
+
+def upgrade():
+    op.create_table('user_event_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('event_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('user_event_stats_date',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    op.execute("CREATE TRIGGER user_event_stats_insert AFTER INSERT ON event BEGIN " + ADD + "END")
+    op.execute("CREATE TRIGGER user_event_stats_delete AFTER DELETE ON event BEGIN " + REMOVE + "END")
+    op.execute(
+        "CREATE TRIGGER user_event_stats_update AFTER UPDATE OF user_id, event_date ON event "
+        "BEGIN " + REMOVE + ADD + "END"
+    )
+
+    # Count the events that already exist, split on today (UTC)
+    op.execute(
+        "INSERT INTO user_event_stats (user_id, event_count, upcoming_count) "
+        "SELECT user_id, count(*), sum(event_date >= date('now')) FROM event GROUP BY user_id"
+    )
+    op.execute("INSERT INTO user_event_stats_date (id, as_of) VALUES (1, date('now'))")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS user_event_stats_update")
+    op.execute("DROP TRIGGER IF EXISTS user_event_stats_delete")
+    op.execute("DROP TRIGGER IF EXISTS user_event_stats_insert")
+    op.drop_table('user_event_stats_date')
+    op.drop_table('user_event_stats')
@@ -0,0 +1,80 @@
+"""Add an append-only change log for incremental client sync
+
+Revision ID: b69945218f8a
+Revises: a7029371a3ac
+Create Date: 2026-10-18 16:02:13.518244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b69945218f8a'
+down_revision = 'a7029371a3ac'
+branch_labels = None
+depends_on = None
+
+LOG = "INSERT INTO change_log (entity, entity_id, user_id, op, changed_at) "
+NOW = "datetime('now')"
+TRIGGERS = {
+    'change_log_event_insert':
+        "AFTER INSERT ON event BEGIN "
+        + LOG + "VALUES ('event', new.id, new.user_id, 'create', " + NOW + "); END",
+    'change_log_event_update':
+        "AFTER UPDATE OF title, description, event_date, user_id ON event BEGIN "
+        + LOG + "VALUES ('event', new.id, new.user_id, 'update', " + NOW + "); "
+        + LOG + "SELECT 'event', old.id, old.user_id, 'delete', " + NOW + " WHERE old.user_id IS NOT new.user_id; END",
+    'change_log_event_delete':
+        "AFTER DELETE ON event BEGIN "
+        + LOG + "VALUES ('event', old.id, old.user_id, 'delete', " + NOW + "); END",
+    'change_log_user_insert':
+        "AFTER INSERT ON user BEGIN "
+        + LOG + "VALUES ('user', new.id, new.id, 'create', " + NOW + "); END",
+    'change_log_user_update':
+        "AFTER UPDATE OF username, email, is_approved, is_admin, deleted_at ON user BEGIN "
+        + LOG + "SELECT 'user', new.id, new.id, "
+        "CASE WHEN new.deleted_at IS NULL THEN 'update' ELSE 'delete' END, " + NOW + " "
+        "WHERE old.deleted_at IS NULL; END",
+    'change_log_user_delete':
+        "AFTER DELETE ON user BEGIN "
+        + LOG + "SELECT 'user', old.id, old.id, 'delete', " + NOW + " WHERE old.deleted_at IS NULL; END",
+}
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=8), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('change_log', schema=None) as batch_op:
+        batch_op.create_index('ix_change_log_entity_seq', ['entity', 'entity_id', 'user_id', 'seq'], unique=False)
+        batch_op.create_index('ix_change_log_user_id_seq', ['user_id', 'seq'], unique=False)
+
+    op.create_table('change_log_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('compacted_through', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Existing rows are the baseline clients download in full; the log
+    # starts with the first write after this migration
+    for name, body in TRIGGERS.items():
+        op.execute("CREATE TRIGGER " + name + " " + body)
+
+
+def downgrade():
+    for name in reversed(list(TRIGGERS)):
+        op.execute("DROP TRIGGER IF EXISTS " + name)
+    op.drop_table('change_log_state')
+    with op.batch_alter_table('change_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_change_log_user_id_seq')
+        batch_op.drop_index('ix_change_log_entity_seq')
+
+    op.drop_table('change_log')
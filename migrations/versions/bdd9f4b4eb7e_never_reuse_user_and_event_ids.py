@@ -0,0 +1,46 @@
+"""Never reuse user and event ids
+
+Revision ID: bdd9f4b4eb7e
+Revises: b69945218f8a
+Create Date: 2026-10-18 16:37:12.402618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bdd9f4b4eb7e'
+down_revision = 'b69945218f8a'
+branch_labels = None
+depends_on = None
+
+TABLES = ('user', 'event')
+
+
+def _rebuild(autoincrement):
+    # SQLite can only add AUTOINCREMENT by copying the table, and dropping
+    # the old table drops its triggers (search, stats, change log), so
+    # they are read back first and created again on the copy
+    conn = op.get_bind()
+    triggers = [
+        sql for (sql,) in conn.execute(sa.text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('user', 'event')"
+        ))
+    ]
+    for table in TABLES:
+        with op.batch_alter_table(
+            table, schema=None, recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}
+        ):
+            pass
+    for sql in triggers:
+        op.execute(sql)
+
+
+def upgrade():
+    # Copying the rows in sets sqlite_sequence to the highest id in use
+    _rebuild(True)
+
+
+def downgrade():
+    _rebuild(False)
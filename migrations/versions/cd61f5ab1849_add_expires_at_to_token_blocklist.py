@@ -0,0 +1,36 @@
+"""Add expires_at to token_blocklist
+
+Revision ID: cd61f5ab1849
+Revises: 70eebcc43bee
+Create Date: 2026-10-18 09:12:41.208133
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd61f5ab1849'
+down_revision = '70eebcc43bee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('token_blocklist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+    # Existing rows were issued with the two hour JWT_ACCESS_TOKEN_EXPIRES
+    op.execute(
+        "UPDATE token_blocklist SET expires_at = datetime(created_at, '+2 hours')"
+    )
+
+    with op.batch_alter_table('token_blocklist', schema=None) as batch_op:
+        batch_op.alter_column('expires_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_token_blocklist_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('token_blocklist', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_token_blocklist_expires_at'))
+        batch_op.drop_column('expires_at')
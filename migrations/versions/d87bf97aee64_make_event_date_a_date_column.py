@@ -0,0 +1,65 @@
+"""Make event.event_date a DATE column and index it
+
+Revision ID: d87bf97aee64
+Revises: cd61f5ab1849
+Create Date: 2026-10-18 10:04:17.552910
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd87bf97aee64'
+down_revision = 'cd61f5ab1849'
+branch_labels = None
+depends_on = None
+
+
+event = sa.table(
+    'event',
+    sa.column('id', sa.Integer()),
+    sa.column('event_date', sa.String(length=20)),
+    sa.column('event_date_new', sa.Date()),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('event_date_new', sa.Date(), nullable=True))
+
+    # Parse the old free-form strings in Python; a plain CAST would turn
+    # '2024-05-11' into the number 2024 on SQLite
+    conn = op.get_bind()
+    bad_rows = []
+    for row_id, value in conn.execute(sa.select(event.c.id, event.c.event_date)):
+        try:
+            parsed = date.fromisoformat(value.strip()[:10])
+        except (AttributeError, ValueError):
+            bad_rows.append(row_id)
+            continue
+        conn.execute(event.update().where(event.c.id == row_id).values(event_date_new=parsed))
+
+    if bad_rows:
+        raise RuntimeError(
+            "event_date is not an ISO date (YYYY-MM-DD) for event ids: %s" % bad_rows
+        )
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_column('event_date')
+        batch_op.alter_column('event_date_new', new_column_name='event_date',
+                              existing_type=sa.Date(), nullable=False)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index('ix_event_user_id_event_date', ['user_id', 'event_date'], unique=False)
+        batch_op.create_index('ix_event_event_date', ['event_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_event_date')
+        batch_op.drop_index('ix_event_user_id_event_date')
+        batch_op.alter_column('event_date', existing_type=sa.Date(),
+                              type_=sa.String(length=20), existing_nullable=False)
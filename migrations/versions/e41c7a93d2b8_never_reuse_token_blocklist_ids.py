@@ -0,0 +1,31 @@
+"""Never reuse token blocklist ids
+
+Revision ID: e41c7a93d2b8
+Revises: bdd9f4b4eb7e
+Create Date: 2026-10-18 16:52:06.227913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41c7a93d2b8'
+down_revision = 'bdd9f4b4eb7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can only add AUTOINCREMENT by copying the table; copying the
+    # rows in sets sqlite_sequence to the highest id in use
+    with op.batch_alter_table(
+        'token_blocklist', schema=None, recreate='always', table_kwargs={'sqlite_autoincrement': True}
+    ):
+        pass
+
+
+def downgrade():
+    with op.batch_alter_table(
+        'token_blocklist', schema=None, recreate='always', table_kwargs={'sqlite_autoincrement': False}
+    ):
+        pass
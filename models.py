@@ -1,9 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 
+from db_profiles import RoutingSession
+
 metadata = MetaData()
 
-db = SQLAlchemy(metadata=metadata)
+# RoutingSession sends queries from read-only views to the replica engine
+db = SQLAlchemy(metadata=metadata, session_options={"class_": RoutingSession})
 
 # User Model
 class User(db.Model):
@@ -13,6 +16,19 @@ class User(db.Model):
     password = db.Column(db.String(128), nullable=False)
     is_approved = db.Column(db.Boolean, default=False)
     is_admin = db.Column(db.Boolean, default=False)
+    # Bumped in the UPDATE itself, as version + 1, on every change; used for
+    # ETags. Not a version_id_col: that would add a WHERE on the old version
+    # and turn overlapping writes into StaleDataError instead of last write wins
+    version = db.Column(
+        db.Integer, nullable=False, default=1, server_default='1', onupdate=db.text('version + 1')
+    )
+    # Set when the account is deleted in the background; the user is hidden
+    # from then on, and the row and its events are purged later
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    # AUTOINCREMENT: a deleted user's id is never handed out again, so an
+    # (id, version) ETag or cache entry can't come to mean another user
+    __table_args__ = {"sqlite_autoincrement": True}
 
     
     # Relationship with Event Model
@@ -25,13 +41,81 @@ class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.String(256), nullable=False)
-    event_date = db.Column(db.String(20), nullable=False)
+    event_date = db.Column(db.Date, nullable=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Bumped in the UPDATE itself, as for User
+    version = db.Column(
+        db.Integer, nullable=False, default=1, server_default='1', onupdate=db.text('version + 1')
+    )
+
+    __table_args__ = (
+        # Date range scans, per user and across all users
+        db.Index('ix_event_user_id_event_date', 'user_id', 'event_date'),
+        db.Index('ix_event_event_date', 'event_date'),
+        # Covers the (id, version) scan behind the per-user events ETag
+        db.Index('ix_event_user_id_version', 'user_id', 'version'),
+        # Ids are never reused, as for User
+        {"sqlite_autoincrement": True},
+    )
     
 
+# Per-user event totals, kept in step with the event table by the triggers in event_stats.py
+class UserEventStats(db.Model):
+    __tablename__ = "user_event_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    # Events dated on or after UserEventStatsDate.as_of
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Single row: the date user_event_stats.upcoming_count is counted from
+class UserEventStatsDate(db.Model):
+    __tablename__ = "user_event_stats_date"
+
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.Date, nullable=False)
+
+
+# Append-only feed of event and user changes, written by the triggers in changelog.py
+class ChangeLog(db.Model):
+    __tablename__ = "change_log"
+
+    # AUTOINCREMENT: a sequence number is never handed out twice, even after
+    # the newest rows have been compacted away
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # Owner of the changed row (the user itself for user changes)
+    user_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # Per-user feeds
+        db.Index('ix_change_log_user_id_seq', 'user_id', 'seq'),
+        # Finding superseded entries when compacting
+        db.Index('ix_change_log_entity_seq', 'entity', 'entity_id', 'user_id', 'seq'),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Single row: every change up to this sequence number may have been compacted away
+class ChangeLogState(db.Model):
+    __tablename__ = "change_log_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    compacted_through = db.Column(db.Integer, nullable=False, default=0)
+
+
 class TokenBlocklist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True)
     created_at = db.Column(db.DateTime, nullable=False)
+    # When the revoked token would have expired anyway; rows past this can be purged
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    # Ids only go up, even after a purge: workers load new rows by `id > last seen`
+    __table_args__ = {"sqlite_autoincrement": True}
 
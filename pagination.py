@@ -0,0 +1,20 @@
+from flask import request
+
+# Default and maximum number of rows returned per page
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def get_limit(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """Read the `limit` query parameter, clamped to a sane page size."""
+    limit = request.args.get('limit', default_limit, type=int)
+
+    # Clamp the page size so a client can't ask for the whole table at once
+    return max(1, min(limit, max_limit))
+
+
+def get_page_args(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """Read the `limit` and `after` keyset pagination parameters from the query string."""
+    limit = get_limit(default_limit, max_limit)
+    after = request.args.get('after', 0, type=int)
+    return limit, after
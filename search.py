@@ -0,0 +1,83 @@
+import re
+
+from sqlalchemy import DDL, event, select, text
+
+from models import db, Event
+
+# External-content FTS5 index over event titles and descriptions. The index
+# stores only the tokens; rows are read back from `event` through the rowid.
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5("
+    "title, description, content='event', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS event_fts_insert AFTER INSERT ON event BEGIN "
+    "INSERT INTO event_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS event_fts_delete AFTER DELETE ON event BEGIN "
+    "INSERT INTO event_fts(event_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS event_fts_update AFTER UPDATE OF title, description ON event BEGIN "
+    "INSERT INTO event_fts(event_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO event_fts(rowid, title, description) VALUES (new.id, new.title, new.description); "
+    "END",
+]
+
+# Title matches count for more than description matches
+BM25_WEIGHTS = (10.0, 1.0)
+
+# {columns} is the select list, so callers can fetch only what they return
+SEARCH_SQL_TEMPLATE = (
+    "SELECT {columns} FROM event_fts JOIN event ON event.id = event_fts.rowid "
+    "WHERE event_fts MATCH :query "
+    # Same as deletion.OWNER_NOT_DELETED
+    "AND event.user_id NOT IN (SELECT id FROM \"user\" WHERE deleted_at IS NOT NULL) "
+    "ORDER BY bm25(event_fts, %s, %s), event.id "
+    "LIMIT :limit OFFSET :offset" % BM25_WEIGHTS
+)
+SEARCH_SQL = SEARCH_SQL_TEMPLATE.format(columns="event.*")
+
+# Keep the index in step with the table whenever it is created with
+# db.create_all() rather than through the migrations
+for statement in SEARCH_DDL:
+    event.listen(Event.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Event.__table__, "before_drop", DDL("DROP TABLE IF EXISTS event_fts").execute_if(dialect="sqlite")
+)
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query that matches every word.
+
+    Each word is quoted so that FTS5 operators and punctuation in user input
+    are treated as plain text instead of query syntax.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join('"%s"' % word for word in words)
+
+
+def search_events(query, limit, offset=0, fields=None):
+    """Return events matching `query`, best BM25 score first.
+
+    With `fields`, only those columns (and the id) are selected and the
+    rest of each Event stays unloaded.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    sql = SEARCH_SQL
+    if fields is not None:
+        names = ["id"] + [name for name in fields if name != "id"]
+        sql = SEARCH_SQL_TEMPLATE.format(columns=", ".join("event." + name for name in names))
+    statement = select(Event).from_statement(text(sql))
+    params = {"query": expression, "limit": limit, "offset": offset}
+    return db.session.scalars(statement, params).all()
+
+
+def rebuild_search_index():
+    """Create the index if needed and repopulate it from the event table."""
+    with db.engine.begin() as conn:
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
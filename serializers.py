@@ -0,0 +1,83 @@
+from datetime import date
+from functools import lru_cache
+
+from sqlalchemy import Date, DateTime, bindparam, select
+
+from streaming import chunked
+
+
+class RowSerializer:
+    """Turns plain result rows for a fixed set of columns into JSON-ready dicts.
+
+    Selecting columns instead of entities skips the ORM entirely: no
+    instances, no identity map, no attribute instrumentation. Everything
+    that depends only on the model and the field list (the columns to
+    select, the key order, which positions hold dates and times) is worked out once
+    here, so turning a row into a dict is a `zip` plus a few isoformat()s.
+
+    `extra` names columns the caller needs from each row (a cursor, a key to
+    group by) without them appearing in the output; they are selected after
+    the fields and read back with `value()`.
+    """
+
+    __slots__ = ("names", "columns", "positions", "_dates", "_id", "_by_id")
+
+    def __init__(self, model, fields, extra=()):
+        self.names = tuple(fields)
+        names = self.names + tuple(name for name in extra if name not in self.names)
+        self.columns = tuple(model.__table__.c[name] for name in names)
+        self.positions = {name: index for index, name in enumerate(names)}
+        self._dates = tuple(
+            index for index, column in enumerate(self.columns[:len(self.names)])
+            if isinstance(column.type, (Date, DateTime))
+        )
+        # Built once and reused, so SQLAlchemy's statement cache key is worked
+        # out on the first lookup only
+        self._id = next(iter(model.__table__.primary_key))
+        self._by_id = self.select().where(self._id == bindparam("id"))
+
+    def select(self):
+        return select(*self.columns)
+
+    def get_row(self, session, id):
+        """The row with primary key `id`, or None if there isn't one."""
+        return session.execute(self._by_id, {"id": id}).first()
+
+    def get(self, session, id):
+        """Serialize the row with primary key `id`, or return None if there isn't one."""
+        row = self.get_row(session, id)
+        return self(row) if row else None
+
+    def get_many(self, session, ids, chunk_size, *criteria):
+        """Fetch the rows for `ids` with one IN query per chunk.
+
+        Returns (rows, missing), both in the order of `ids`; the primary key
+        must be among the selected columns. Rows not matching `criteria` count as
+        missing.
+        """
+        position = self.positions[self._id.name]
+        found = {}
+        for chunk in chunked(ids, chunk_size):
+            for row in session.execute(self.select().where(self._id.in_(chunk), *criteria)):
+                found[row[position]] = row
+        rows = [found[id] for id in ids if id in found]
+        missing = [id for id in ids if id not in found]
+        return rows, missing
+
+    def value(self, row, name):
+        return row[self.positions[name]]
+
+    def __call__(self, row):
+        # zip() stops at the last field, leaving the extra columns out
+        data = dict(zip(self.names, row))
+        for index in self._dates:
+            value = row[index]
+            if isinstance(value, date):
+                data[self.names[index]] = value.isoformat()
+        return data
+
+
+@lru_cache(maxsize=256)
+def serializer(model, fields, extra=()):
+    """The shared RowSerializer for `model` and a tuple of field names."""
+    return RowSerializer(model, fields, extra)
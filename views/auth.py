@@ -1,13 +1,21 @@
+import logging
+
 from flask import Blueprint, request, jsonify
 from models import User, db,TokenBlocklist
+from blocklist import revocation_cache
+from cache import entity_cache
+from views.user import get_cached_user, remove_user
 from datetime import datetime
 from datetime import timezone
-from werkzeug.security import check_password_hash
+from hashing import password_hasher
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity,get_jwt
 
 
 auth_bp = Blueprint("auth_bp", __name__)
 
+# Never pass passwords, hashes or tokens to this logger
+log = logging.getLogger(__name__)
+
 # register
 
 # user registration
@@ -26,7 +34,7 @@ def register_user():
     if current_user:
         return jsonify({"message": "User with this email already exists"}), 400
 
-    hashed_password = check_password_hash(password)
+    hashed_password = password_hasher.hash(password)
     new_user = User(username=username, email=email, password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
@@ -43,31 +51,26 @@ def login():
     
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
-    
-    # Log the provided email and password for debugging
-    print(f"Login attempt with email: {email}, password: {password}")
 
     # Look for user by email
-    user = User.query.filter_by(email=email).first()
-
-    if user:
-        print(f"User found: {user.username}, stored password hash: {user.password}")
-    else:
-        print("No user found with this email")
+    user = User.query.filter_by(email=email, deleted_at=None).first()
 
     if not user:
+        log.info("Login failed: unknown email")
         return jsonify({"error": "Email not found"}), 401  
 
-    # Log the password check
-    if not check_password_hash(user.password, password):
-        print("Password mismatch!")
+    if not password_hasher.verify(user.password, password):
+        log.info("Login failed: incorrect password", extra={"user_id": user.id})
         return jsonify({"error": "Incorrect password"}), 401 
+
+    # Upgrade hashes made with an older method or cost now that we know the password
+    if password_hasher.needs_rehash(user.password):
+        user.password = password_hasher.hash(password)
+        db.session.commit()
     
     # If user is found and password matches, generate JWT token
-    access_token = create_access_token(identity=user.id)
-
-    # Log the access token for debugging purposes
-    print(f"Generated Access Token: {access_token}")  
+    access_token = create_access_token(identity=str(user.id))
+    log.info("Login succeeded", extra={"user_id": user.id})
 
     # Return success message with token and user data
     return jsonify({
@@ -87,22 +90,20 @@ def login():
 def current_user():
     try:
         current_user_id = get_jwt_identity()  # Get the user ID from JWT
-        print(f"Decoded User ID from JWT: {current_user_id}")  # Log the user ID for debugging
+        log.debug("Current user requested", extra={"user_id": current_user_id})
         
-        user = User.query.get(current_user_id)
+        # Read the version first, as get_user does, so a cached copy never
+        # outlives an update or a soft delete made through another worker
+        version = db.session.query(User.version).filter_by(id=current_user_id, deleted_at=None).scalar()
+        user = get_cached_user(current_user_id, version) if version is not None else None
 
         if user:
-            return jsonify({
-                "id": user.id,
-                "username": user.username,
-                "email": user.email
-            }), 200
+            return jsonify(user), 200
         else:
             return jsonify({"message": "User not found"}), 404
     
     except Exception as e:
-        # Log the exception to help debug
-        print(f"Error during token decoding or user lookup: {str(e)}")
+        log.exception("Current user lookup failed")
         return jsonify({"message": str(e)}), 500
     
 
@@ -111,10 +112,13 @@ def current_user():
 @auth_bp.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
-    jti = get_jwt()["jti"]
+    token = get_jwt()
+    jti = token["jti"]
     now = datetime.now(timezone.utc)
-    db.session.add(TokenBlocklist(jti=jti, created_at=now))
+    expires_at = datetime.fromtimestamp(token["exp"], timezone.utc)
+    db.session.add(TokenBlocklist(jti=jti, created_at=now, expires_at=expires_at))
     db.session.commit()
+    revocation_cache.revoke(jti)
     return jsonify({"success ":"Logged out successfully"})
 
 
@@ -127,7 +131,7 @@ def update_password():
 
     # Fetch the current user from the database
     user = User.query.get(current_user_id)
-    if not user:
+    if not user or user.deleted_at is not None:
         return jsonify({"message": "User not found"}), 404
 
     # Get the old password and new password from the request
@@ -138,13 +142,14 @@ def update_password():
         return jsonify({"message": "Old and new passwords are required"}), 400
 
     # Check if the old password matches
-    if not check_password_hash(user.password, old_password):
+    if not password_hasher.verify(user.password, old_password):
         return jsonify({"message": "Incorrect old password"}), 400
 
     # Hash the new password
-    user.password = check_password_hash(new_password)
+    user.password = password_hasher.hash(new_password)
     
     db.session.commit()
+    entity_cache.invalidate(User, current_user_id)
 
     return jsonify({"message": "Password updated successfully"}), 200
 
@@ -155,14 +160,12 @@ def update_password():
 def delete_account():
     current_user_id = get_jwt_identity()  
 
-    # Fetch the current user from the database
-    user = User.query.get(current_user_id)
-    if not user:
+    # Events go with the account; big accounts are finished off in the background
+    outcome = remove_user(int(current_user_id))
+    if outcome is None:
         return jsonify({"message": "User not found"}), 404
-
-    # Delete the user from the database
-    db.session.delete(user)
-    db.session.commit()
+    if outcome == "scheduled":
+        return jsonify({"message": "User account scheduled for deletion"}), 202
 
     return jsonify({"message": "User account deleted successfully"}), 200
 
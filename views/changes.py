@@ -0,0 +1,56 @@
+from flask import Blueprint, request, jsonify
+from changelog import feed_bounds
+from db_profiles import read_only
+from models import db, ChangeLog
+from pagination import get_limit
+from serializers import serializer
+
+changes_bp = Blueprint("changes_bp", __name__)
+
+CHANGE_FIELDS = ("seq", "entity", "entity_id", "user_id", "op", "changed_at")
+
+
+# READ Changes after a sequence number
+@changes_bp.route("/changes", methods=['GET'])
+@read_only
+def list_changes():
+    """Return event and user changes after `since`, oldest first.
+
+    Each entry names the row and what happened to it ("create", "update" or
+    "delete"); clients fetch the rows that still exist through
+    /events?ids= and /users?ids=, then call again with `next_since`. With
+    `user_id`, only changes to that user and their events are returned.
+
+    A client starting from scratch does a full download and then syncs from
+    the `latest_seq` it read before that. If `since` is older than what
+    compaction has kept, the answer is 410 and the client has to start over.
+    """
+    since = request.args.get('since', 0, type=int)
+    user_id = request.args.get('user_id', type=int)
+    limit = get_limit()
+
+    compacted_through, latest = feed_bounds()
+    if since < compacted_through:
+        return jsonify({
+            "message": "Changes up to %d have been compacted; resync from scratch" % compacted_through,
+            "latest_seq": latest
+        }), 410
+
+    to_change = serializer(ChangeLog, CHANGE_FIELDS)
+    query = to_change.select().where(ChangeLog.seq > since)
+    if user_id is not None:
+        query = query.where(ChangeLog.user_id == user_id)
+    rows = db.session.execute(query.order_by(ChangeLog.seq).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Read in the same transaction as `latest`, so once a client has caught
+    # up it can skip straight past changes it filtered out
+    next_since = to_change.value(rows[-1], "seq") if has_more else max(since, latest)
+
+    return jsonify({
+        "changes": [to_change(row) for row in rows],
+        "next_since": next_since,
+        "has_more": has_more,
+        "latest_seq": latest
+    }), 200
@@ -1,14 +1,59 @@
 # event.py
-from flask import Blueprint, request, jsonify
+import json
+import threading
+from datetime import date
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from broker import event_broker, format_message
+from cache import entity_cache
+from db_profiles import read_only
+from deletion import OWNER_NOT_DELETED
+from conditional import conditional_response, make_etag
+from fieldsets import get_fields, load_fields, project, to_dict
+from lookup import LOOKUP_CHUNK_SIZE, get_ids
 from models import db, Event  # Import Event model
+from pagination import get_limit, get_page_args
+from search import search_events
+from serializers import serializer
+from streaming import STREAM_BATCH_SIZE, chunked, iter_request_items, stream_format, stream_response
 from werkzeug.security import generate_password_hash
 
 event_bp = Blueprint("event_bp", __name__)
 
-# CREATE Event
-@event_bp.route("/event", methods=['POST'])
-def create_event():
-    data = request.get_json()
+# Number of events inserted per transaction by the bulk endpoint
+BULK_CHUNK_SIZE = 500
+
+
+def parse_date(value):
+    """Parse an ISO (YYYY-MM-DD) date string, returning None if it isn't one."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Everything an event read returns; ?fields= picks a subset
+EVENT_FIELDS = ("id", "title", "description", "event_date", "user_id")
+# The same, minus the owner, for events listed under their user
+USER_EVENT_FIELDS = ("id", "title", "description", "event_date")
+
+
+def event_to_dict(event, fields=EVENT_FIELDS):
+    return to_dict(event, fields)
+
+
+def user_event_to_dict(event, fields=USER_EVENT_FIELDS):
+    """An event as it is listed under its user."""
+    return to_dict(event, fields)
+
+
+def validate_event(data):
+    """Check an incoming event payload, returning (fields, error)."""
+    if not isinstance(data, dict):
+        return None, "Invalid event"
+
     title = data.get('title')
     description = data.get('description')
     event_date = data.get('event_date')
@@ -16,62 +61,333 @@ def create_event():
 
     # Validate required fields
     if not title or not description or not event_date or not user_id:
-        return jsonify({"message": "Missing fields"}), 400
+        return None, "Missing fields"
 
-    new_event = Event(
-        title=title,
-        description=description,
-        event_date=event_date,
-        user_id=user_id
-    )
+    event_date = parse_date(event_date)
+    if event_date is None:
+        return None, "Invalid event_date, expected YYYY-MM-DD"
+
+    return {
+        "title": title,
+        "description": description,
+        "event_date": event_date,
+        "user_id": user_id
+    }, None
+
+
+# CREATE Event
+@event_bp.route("/event", methods=['POST'])
+def create_event():
+    fields, error = validate_event(request.get_json())
+    if error:
+        return jsonify({"message": error}), 400
+
+    new_event = Event(**fields)
 
     db.session.add(new_event)
     db.session.commit()
+    event = event_to_dict(new_event)
+    event_broker.publish("create", event)
+
+    return jsonify({"message": "Event created", "event": event}), 201
+
+def _insert_events(rows):
+    """Insert one chunk of validated rows, returning a new id or an error per row."""
+    try:
+        # One multi-row VALUES statement. SQLAlchemy can't order RETURNING rows
+        # on SQLite and would fall back to an INSERT per row, but new rowids are
+        # handed out in increasing VALUES order, so sorting the ids lines them up
+        ids = sorted(db.session.execute(
+            insert(Event).values(rows).returning(Event.id)
+        ).scalars())
+        db.session.commit()
+        return [(event_id, None) for event_id in ids]
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    # Something in the chunk was rejected; retry row by row to find out what
+    results = []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                event_id = db.session.execute(insert(Event).returning(Event.id), row).scalar()
+            results.append((event_id, None))
+        except SQLAlchemyError:
+            results.append((None, "Could not save event"))
+    db.session.commit()
+    return results
+
+
+# CREATE Events in bulk
+@event_bp.route("/events/bulk", methods=['POST'])
+def create_events_bulk():
+    """Create events from a JSON array or an NDJSON stream.
+
+    Results are streamed back as NDJSON, one line per input item followed by a
+    summary line, and each chunk of BULK_CHUNK_SIZE rows is committed in its
+    own transaction so memory stays flat however large the upload is.
+    """
+    items = iter_request_items()
+
+    def generate():
+        created = failed = 0
+        for chunk in chunked(enumerate(items), BULK_CHUNK_SIZE):
+            results = {}
+            rows, row_indexes = [], []
+            for index, (data, error) in chunk:
+                if not error:
+                    fields, error = validate_event(data)
+                if error:
+                    results[index] = {"index": index, "error": error}
+                else:
+                    rows.append(fields)
+                    row_indexes.append(index)
+
+            if rows:
+                for index, row, (event_id, error) in zip(row_indexes, rows, _insert_events(rows)):
+                    if error:
+                        results[index] = {"index": index, "error": error}
+                    else:
+                        results[index] = {"index": index, "id": event_id}
+                        event_broker.publish("create", {
+                            "id": event_id, **row, "event_date": row["event_date"].isoformat()
+                        })
+
+            for index, _ in chunk:
+                if "id" in results[index]:
+                    created += 1
+                else:
+                    failed += 1
+                yield json.dumps(results[index]) + "\n"
+
+        yield json.dumps({"created": created, "failed": failed}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
-    return jsonify({"message": "Event created", "event": {
-        "id": new_event.id,
-        "title": new_event.title,
-        "description": new_event.description,
-        "event_date": new_event.event_date,
-        "user_id": new_event.user_id
-    }}), 201
+# STREAM Event changes as server-sent events
+@event_bp.route('/events/stream', methods=['GET'])
+def stream_events():
+    """Push event creates, updates and deletes to the client as they happen.
+
+    With `user_id`, only that user's events are sent. The connection is held
+    by one request thread waiting on the broker, without a database
+    connection; a comment line every EVENT_STREAM_HEARTBEAT seconds keeps
+    proxies from closing it and notices clients that have gone. A client
+    that falls too far behind is sent an "overflow" event and disconnected,
+    and should catch up from /changes.
+
+    Only EVENT_STREAM_MAX_SUBSCRIBERS clients are served at once, so idle
+    streams can't take every request thread; past that clients get a 503
+    and should retry later, or use the ASGI app, where a subscriber is just
+    a coroutine.
+    """
+    user_id = request.args.get('user_id', type=int)
+    heartbeat = event_broker.heartbeat
+    slots = event_broker.slots
+    if not slots.acquire(blocking=False):
+        response = jsonify({"message": "Too many stream subscribers, please retry"})
+        response.headers["Retry-After"] = str(heartbeat)
+        return response, 503
+
+    def generate():
+        wake = threading.Event()
+        subscription = event_broker.subscribe(user_id, wake.set)
+        try:
+            yield ": subscribed\n\n"
+            while True:
+                if not wake.wait(heartbeat):
+                    yield ": heartbeat\n\n"
+                    continue
+                wake.clear()
+                messages = subscription.drain()
+                if messages:
+                    yield "".join(format_message(message) for message in messages)
+                if subscription.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Tells nginx not to buffer the stream
+        "X-Accel-Buffering": "no"
+    })
+    # Runs even if the client left before the body was started
+    response.call_on_close(slots.release)
+    return response
+
+# READ Events by ID, many at once
+@event_bp.route('/events/lookup', methods=['POST'])
+@read_only
+def lookup_events():
+    """Fetch the events whose ids are listed in the request, in that order.
+
+    Takes `?ids=` (through GET /events) or a JSON `{"ids": [...]}` body, and
+    answers with one IN query per LOOKUP_CHUNK_SIZE ids. Ids with no event
+    are listed under `missing`.
+    """
+    fields, error = get_fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+    ids, error = get_ids()
+    if error:
+        return jsonify({"message": error}), 400
+
+    # The same serializer get_event fills the cache with, narrowed to the fields asked for
+    to_event = serializer(Event, fields, ("id",))
+    rows, missing = to_event.get_many(db.session, ids, LOOKUP_CHUNK_SIZE, OWNER_NOT_DELETED)
+    return jsonify({"events": [to_event(row) for row in rows], "missing": missing}), 200
+
+# READ Events in a date range
+@event_bp.route('/events', methods=['GET'])
+@read_only
+def list_events():
+    """List events ordered by date, optionally for one user and between two dates.
+
+    Filters on `user_id`, `from` and `to` (inclusive ISO dates) are answered from
+    the (user_id, event_date) index, and pages are walked with an `after` cursor
+    of the form "<event_date>_<id>" taken from `next_cursor`. With `ids` the
+    request is a multi-get instead; see lookup_events.
+    """
+    if "ids" in request.args:
+        return lookup_events()
+
+    limit = get_limit()
+    user_id = request.args.get('user_id', type=int)
+    fields, error = get_fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    after = request.args.get('after')
+
+    # The cursor columns are always loaded, even when they aren't returned
+    query = select(Event).options(load_fields(Event, fields, "id", "event_date")).where(OWNER_NOT_DELETED)
+    if user_id is not None:
+        query = query.where(Event.user_id == user_id)
+    if date_from:
+        date_from = parse_date(date_from)
+        if date_from is None:
+            return jsonify({"message": "Invalid from date, expected YYYY-MM-DD"}), 400
+        query = query.where(Event.event_date >= date_from)
+    if date_to:
+        date_to = parse_date(date_to)
+        if date_to is None:
+            return jsonify({"message": "Invalid to date, expected YYYY-MM-DD"}), 400
+        query = query.where(Event.event_date <= date_to)
+    if after:
+        after_date, _, after_id = after.partition('_')
+        after_date = parse_date(after_date)
+        if after_date is None or not after_id.isdigit():
+            return jsonify({"message": "Invalid cursor"}), 400
+        query = query.where(tuple_(Event.event_date, Event.id) > tuple_(after_date, int(after_id)))
+
+    events = db.session.scalars(query.order_by(Event.event_date, Event.id).limit(limit + 1)).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = "%s_%d" % (events[-1].event_date.isoformat(), events[-1].id)
+
+    return jsonify({
+        "events": [event_to_dict(event, fields) for event in events],
+        "next_cursor": next_cursor
+    }), 200
+
+# SEARCH Events by title and description
+@event_bp.route('/events/search', methods=['GET'])
+@read_only
+def search_events_view():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"message": "Missing search query"}), 400
+    fields, error = get_fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+
+    # Results are ordered by relevance, so the cursor is an offset into them
+    limit, offset = get_page_args()
+    events = search_events(query, limit + 1, offset, fields)
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    return jsonify({
+        "events": [event_to_dict(event, fields) for event in events],
+        "next_cursor": offset + limit if has_more else None
+    }), 200
 
 # READ Event by ID
 @event_bp.route('/event/<int:event_id>', methods=['GET'])
+@read_only
 def get_event(event_id):
-    event = Event.query.get(event_id)
+    fields, error = get_fields(EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
 
-    if not event:
+    # Only the version is read up front; the row itself is loaded if the client's copy is stale
+    version = db.session.query(Event.version).filter(Event.id == event_id, OWNER_NOT_DELETED).scalar()
+
+    if version is None:
         return jsonify({"message": "Event not found"}), 404
 
-    return jsonify({
-        "id": event.id,
-        "title": event.title,
-        "description": event.description,
-        "event_date": event.event_date,
-        "user_id": event.user_id
-    }), 200
+    def load():
+        return serializer(Event, EVENT_FIELDS).get(db.session, event_id)
+
+    # The cache holds the whole row, so one entry serves every field selection
+    etag = make_etag("event", event_id, version)
+    return conditional_response(
+        etag, lambda: (jsonify(project(entity_cache.get_or_load(Event, event_id, load, version), fields)), 200)
+    )
 
 # READ all Events for a specific User
 @event_bp.route('/user/<int:user_id>/events', methods=['GET'])
+@read_only
 def get_user_events(user_id):
-    events = Event.query.filter_by(user_id=user_id).all()
+    fields, error = get_fields(USER_EVENT_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+
+    # The ETag comes from (id, version) pairs read off the index, without loading the rows
+    versions = db.session.execute(
+        select(Event.id, Event.version).where(Event.user_id == user_id, OWNER_NOT_DELETED)
+    ).all()
 
-    if not events:
+    if not versions:
         return jsonify({"message": "No events found for this user"}), 404
 
-    return jsonify([{
-        "id": event.id,
-        "title": event.title,
-        "description": event.description,
-        "event_date": event.event_date
-    } for event in events]), 200
+    # The negotiated format is part of the tag: JSON and NDJSON bodies of the
+    # same rows are different representations, and the gzipped copy of one
+    # must never be served for the other
+    fmt = stream_format()
+    etag = make_etag("user-events", user_id, fmt, *sorted(versions))
+    # Plain rows of just the requested columns; no ORM objects are built
+    to_event = serializer(Event, fields)
+    query = to_event.select().where(Event.user_id == user_id).order_by(Event.id)
+
+    def build():
+        if fmt:
+            # Runs while the response is being sent, inside the streamed request context
+            def rows():
+                for row in db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+                    yield to_event(row)
+
+            return stream_response(rows(), fmt)
+
+        return jsonify([to_event(row) for row in db.session.execute(query)]), 200
+
+    response = conditional_response(etag, build)
+    response.vary.add("Accept")
+    return response
 
 # UPDATE Event by ID
 @event_bp.route('/event/<int:event_id>', methods=['PUT'])
 def update_event(event_id):
     data = request.get_json()
-    event = Event.query.get(event_id)
+    # Events of a user marked deleted are gone, as on the read paths
+    event = Event.query.filter(Event.id == event_id, OWNER_NOT_DELETED).first()
 
     if not event:
         return jsonify({"message": "Event not found"}), 404
@@ -80,6 +396,11 @@ def update_event(event_id):
     description = data.get('description')
     event_date = data.get('event_date')
 
+    if event_date:
+        event_date = parse_date(event_date)
+        if event_date is None:
+            return jsonify({"message": "Invalid event_date, expected YYYY-MM-DD"}), 400
+
     if title:
         event.title = title
     if description:
@@ -88,24 +409,24 @@ def update_event(event_id):
         event.event_date = event_date
 
     db.session.commit()
+    entity_cache.invalidate(Event, event_id)
+    data = event_to_dict(event)
+    event_broker.publish("update", data)
 
-    return jsonify({"message": "Event updated", "event": {
-        "id": event.id,
-        "title": event.title,
-        "description": event.description,
-        "event_date": event.event_date,
-        "user_id": event.user_id
-    }}), 200
+    return jsonify({"message": "Event updated", "event": data}), 200
 
 # DELETE Event by ID
 @event_bp.route('/event/<int:event_id>', methods=['DELETE'])
 def delete_event(event_id):
-    event = Event.query.get(event_id)
+    event = Event.query.filter(Event.id == event_id, OWNER_NOT_DELETED).first()
 
     if not event:
         return jsonify({"message": "Event not found"}), 404
 
+    user_id = event.user_id
     db.session.delete(event)
     db.session.commit()
+    entity_cache.invalidate(Event, event_id)
+    event_broker.publish("delete", {"id": event_id, "user_id": user_id})
 
     return jsonify({"message": "Event deleted"}), 200
@@ -1,34 +1,137 @@
-from flask import Blueprint, request, jsonify
-from models import db, User
-from werkzeug.security import generate_password_hash
+from flask import Blueprint, current_app, request, jsonify
+from cache import entity_cache
+from db_profiles import read_only
+from conditional import conditional_response, make_etag
+from deletion import delete_or_schedule
+from event_stats import event_stats_page
+from fieldsets import get_fields, project, to_dict
+from lookup import LOOKUP_CHUNK_SIZE, get_ids
+from models import db, Event, User
+from pagination import get_page_args
+from serializers import serializer
+from streaming import STREAM_BATCH_SIZE, chunked, stream_format, stream_response
+from views.event import USER_EVENT_FIELDS, user_event_to_dict
+from hashing import password_hasher
 
 user_bp = Blueprint("user_bp", __name__)
 
+# Everything /users returns per user; ?fields= picks a subset
+USER_LIST_FIELDS = ("id", "email", "is_approved", "is_admin", "username", "events")
+# Everything a single user read returns
+USER_FIELDS = ("id", "username", "email")
+
+
+def listed_user_to_dict(user, fields=USER_LIST_FIELDS):
+    """A user as /users lists them, from an ORM object with its events loaded if asked for."""
+    data = to_dict(user, [name for name in fields if name != "events"])
+    if "events" in fields:
+        data["events"] = [user_event_to_dict(event) for event in user.events]
+    return data
+
+
+def _serialize_users(rows, fields, to_user):
+    """Turn a batch of user rows into dicts, attaching their events with one query if asked for."""
+    users = [to_user(row) for row in rows]
+    if "events" in fields and rows:
+        user_ids = [to_user.value(row, "id") for row in rows]
+        to_event = serializer(Event, USER_EVENT_FIELDS, ("user_id",))
+        events = {user_id: [] for user_id in user_ids}
+        query = to_event.select().where(Event.user_id.in_(user_ids)).order_by(Event.id)
+        for row in db.session.execute(query):
+            events[to_event.value(row, "user_id")].append(to_event(row))
+        for user, user_id in zip(users, user_ids):
+            user["events"] = events[user_id]
+    return users
+
+
+# READ Users by ID, many at once
+@user_bp.route("/users/lookup", methods=['POST'])
+@read_only
+def lookup_users():
+    """Fetch the users whose ids are listed in the request, in that order.
+
+    Takes `?ids=` (through GET /users) or a JSON `{"ids": [...]}` body, and
+    answers with one IN query per LOOKUP_CHUNK_SIZE ids, plus one for the
+    events of each chunk if they were asked for. Ids with no user are listed
+    under `missing`.
+    """
+    fields, error = get_fields(USER_LIST_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+    ids, error = get_ids()
+    if error:
+        return jsonify({"message": error}), 400
+
+    to_user = serializer(User, tuple(name for name in fields if name != "events"), ("id",))
+    rows, missing = to_user.get_many(db.session, ids, LOOKUP_CHUNK_SIZE, User.deleted_at.is_(None))
+    users = []
+    for batch in chunked(rows, LOOKUP_CHUNK_SIZE):
+        users += _serialize_users(batch, fields, to_user)
+    return jsonify({"users": users, "missing": missing})
+
+
 @user_bp.route("/users")
+@read_only
 def fetch_users():
-    users = User.query.all()
-
-    # Initialize user_list before using it
-    user_list = []  
-
-    for user in users:
-        user_list.append({
-            'id': user.id,
-            'email': user.email,
-            'is_approved': user.is_approved,
-            'is_admin': user.is_admin,
-            'username': user.username,
-            'events': [  
-                {
-                    "id": event.id,
-                    "title": event.title,
-                    "description": event.description,
-                    "event_date": event.deadline 
-                } for event in user.events  
-            ]
-        })
-
-    return jsonify(user_list)  
+    if "ids" in request.args:
+        return lookup_users()
+
+    limit, after = get_page_args()
+    fields, error = get_fields(USER_LIST_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+
+    # Keyset pagination: walk the primary key index instead of using OFFSET.
+    # Only the requested columns are selected, as plain rows rather than ORM
+    # objects, and events are only loaded if asked for, for a whole batch of
+    # users in one extra query instead of one per user
+    to_user = serializer(User, tuple(name for name in fields if name != "events"), ("id",))
+    query = to_user.select().where(User.id > after, User.deleted_at.is_(None)).order_by(User.id)
+
+    # Streaming mode returns every user after the cursor, fetched and written out
+    # in batches instead of being built up in memory first
+    fmt = stream_format()
+    if fmt:
+        # Runs while the response is being sent, inside the streamed request context
+        def rows():
+            result = db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            for batch in result.partitions():
+                yield from _serialize_users(batch, fields, to_user)
+
+        response = stream_response(rows(), fmt)
+        response.vary.add("Accept")
+        return response
+
+    # The extra row only tells us whether there is another page
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response = jsonify({
+        "users": _serialize_users(rows, fields, to_user),
+        "next_cursor": to_user.value(rows[-1], "id") if has_more else None
+    })
+    response.vary.add("Accept")
+    return response
+
+# READ per-user event totals
+@user_bp.route("/users/stats")
+def user_event_stats():
+    """Event counts per user, split into upcoming (dated today or later, UTC) and past.
+
+    Read from the user_event_stats table the event triggers maintain, so a
+    page costs the same however many events there are. Users are walked by
+    id with the same `limit`/`after` cursor as /users; `totals` covers all
+    users. Not read-only: the first request of a day moves that day's
+    events from upcoming to past.
+    """
+    limit, after = get_page_args()
+    return jsonify(event_stats_page(db.session, limit, after))
+
+def user_to_dict(user):
+    return to_dict(user, USER_FIELDS)
+
+
 # CREATE User
 @user_bp.route("/user", methods=['POST'])
 def create_user():
@@ -51,31 +154,43 @@ def create_user():
         return jsonify({"message": "Email already exists"}), 400
 
     # Hash the password before storing it
-    hashed_password = generate_password_hash(password)
+    hashed_password = password_hasher.hash(password)
     new_user = User(username=username, email=email, password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
 
     return jsonify({
         "message": "User created",
-        "user": {
-            "id": new_user.id,
-            "username": new_user.username,
-            "email": new_user.email
-        }
+        "user": user_to_dict(new_user)
     }), 201
 
 # READ User by ID
+def get_cached_user(user_id, version=None):
+    """Return the public fields of a user through the entity cache, or None."""
+    def load():
+        # Users marked for deletion read as missing
+        to_user = serializer(User, USER_FIELDS, ("deleted_at",))
+        row = to_user.get_row(db.session, user_id)
+        return to_user(row) if row and to_user.value(row, "deleted_at") is None else None
+
+    return entity_cache.get_or_load(User, user_id, load, version)
+
+
 @user_bp.route('/user/<int:user_id>', methods=['GET'])
+@read_only
 def get_user(user_id):
-    user = User.query.get(user_id)
-    if not user:
+    fields, error = get_fields(USER_FIELDS)
+    if error:
+        return jsonify({"message": error}), 400
+
+    # Only the version is read up front; the row itself is loaded if the client's copy is stale
+    version = db.session.query(User.version).filter_by(id=user_id, deleted_at=None).scalar()
+    if version is None:
         return jsonify({"message": "User not found"}), 404
-    return jsonify({
-        "id": user.id,
-        "username": user.username,
-        "email": user.email
-    }), 200
+
+    # The cache holds the whole row, so one entry serves every field selection
+    etag = make_etag("user", user_id, version)
+    return conditional_response(etag, lambda: (jsonify(project(get_cached_user(user_id, version), fields)), 200))
 
 # UPDATE User by ID
 @user_bp.route('/user/<int:user_id>', methods=['PUT'])
@@ -83,7 +198,7 @@ def update_user(user_id):
     data = request.get_json()
     user = User.query.get(user_id)
     
-    if not user:
+    if not user or user.deleted_at is not None:
         return jsonify({"message": "User not found"}), 404
 
     # Retrieve new values or keep old ones
@@ -108,28 +223,46 @@ def update_user(user_id):
     if email:
         user.email = email
     if password:
-        user.password = generate_password_hash(password)
+        user.password = password_hasher.hash(password)
 
     db.session.commit()
+    entity_cache.invalidate(User, user_id)
 
     return jsonify({
         "message": "User updated",
-        "user": {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email
-        }
+        "user": user_to_dict(user)
     }), 200
 
 # DELETE User by ID
+def remove_user(user_id):
+    """Delete a user and their events, or hand them to the background purge.
+
+    Accounts with more than USER_DELETE_ASYNC_THRESHOLD events, or any
+    account when the request has `?async=true`, are only marked deleted, so
+    the request takes the same time whatever their size. Returns "deleted",
+    "scheduled", or None if there is no such user.
+    """
+    config = current_app.config
+    outcome = delete_or_schedule(
+        db.session,
+        user_id,
+        batch_size=config["USER_DELETE_BATCH_SIZE"],
+        pause=config["USER_DELETE_PAUSE"],
+        async_threshold=config["USER_DELETE_ASYNC_THRESHOLD"],
+        force_async=request.args.get("async", "").lower() in ("1", "true", "yes"),
+    )
+    if outcome:
+        entity_cache.invalidate(User, user_id)
+    return outcome
+
+
 @user_bp.route('/user/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
-    user = User.query.get(user_id)
+    outcome = remove_user(user_id)
 
-    if not user:
+    if outcome is None:
         return jsonify({"message": "User not found"}), 404
-
-    db.session.delete(user)
-    db.session.commit()
+    if outcome == "scheduled":
+        return jsonify({"message": "User scheduled for deletion"}), 202
 
     return jsonify({"message": "User deleted"}), 200